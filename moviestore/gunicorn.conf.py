@@ -0,0 +1,56 @@
+"""
+Gunicorn config for moviestore, read by gunicorn from the working directory:
+
+    gunicorn                  # WSGI, threaded workers
+    SERVER_INTERFACE=asgi gunicorn   # ASGI, uvicorn workers
+
+Every value can be set with an environment variable, like settings.py.
+https://docs.gunicorn.org/en/20.1.0/settings.html
+"""
+import multiprocessing
+import os
+
+interface = os.environ.get('SERVER_INTERFACE', 'wsgi')
+if interface not in ('wsgi', 'asgi'):
+    raise ValueError(f'SERVER_INTERFACE must be wsgi or asgi, not {interface!r}')
+
+bind = os.environ.get('SERVER_BIND', '0.0.0.0:8000')
+
+if interface == 'asgi':
+    wsgi_app = 'moviestore.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    # an event loop per worker serves many connections, one worker per core
+    default_workers = multiprocessing.cpu_count()
+else:
+    wsgi_app = 'moviestore.wsgi:application'
+    # unlike sync workers, gthread workers tell the master they are alive while
+    # a request runs, so a long streamed export is not killed after timeout
+    worker_class = 'gthread'
+    default_workers = multiprocessing.cpu_count() * 2 + 1
+workers = int(os.environ.get('WEB_CONCURRENCY', default_workers))
+threads = int(os.environ.get('SERVER_THREADS', 1))
+
+# load Django once in the master, the workers share its memory pages
+preload_app = bool(int(os.environ.get('SERVER_PRELOAD', 1)))
+
+# recycle a worker after about this many requests to cap memory growth,
+# the jitter keeps the workers from restarting all at once
+max_requests = int(os.environ.get('SERVER_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('SERVER_MAX_REQUESTS_JITTER', max_requests // 10))
+
+# seconds a worker gets to finish its requests on SIGTERM or recycling
+graceful_timeout = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 30))
+# seconds a silent worker is given before it is restarted, not a request time limit
+timeout = int(os.environ.get('SERVER_TIMEOUT', 60))
+keepalive = int(os.environ.get('SERVER_KEEPALIVE', 5))
+
+accesslog = os.environ.get('SERVER_ACCESS_LOG', '-') or None
+errorlog = '-'
+loglevel = os.environ.get('SERVER_LOG_LEVEL', 'info')
+
+
+def pre_fork(server, worker):
+    # a connection opened while preloading must not be shared with the workers
+    if server.cfg.preload_app:
+        from django.db import connections
+        connections.close_all()
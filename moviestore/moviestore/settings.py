@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'django_filters',
 ]
@@ -51,6 +53,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'storeapi.routers.primary_pin_middleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -79,16 +82,103 @@ WSGI_APPLICATION = 'moviestore.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
+# DB_CONN_MAX_AGE keeps connections open between requests for that many
+# seconds (0 closes them after every request), DB_HEALTH_CHECKS checks a
+# reused connection before the request first uses it (storeapi.backends).
+# DB_POOLER=1 is for a transaction pooling PgBouncer (DB_PORT usually 6432):
+# server side cursors and session settings, like the SET TIME ZONE Django
+# runs on connect, do not survive the end of a transaction there. The exports
+# and settle_rentals then read their rows by keyset (storeapi.db.iterate_rows).
+
+DB_POOLER = bool(int(os.environ.get('DB_POOLER', 0)))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'storeapi.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
+        'PORT': os.environ.get('DB_PORT', ''),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASSWORD'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'DISABLE_SERVER_SIDE_CURSORS': DB_POOLER,
     }
 }
 
+DB_HEALTH_CHECKS = bool(int(os.environ.get('DB_HEALTH_CHECKS', 1)))
+
+# Read replicas, DB_REPLICA_HOSTS is a comma separated list of hosts with the
+# credentials of the primary. The catalog and history lists read from a
+# replica lagging at most DB_REPLICA_MAX_LAG seconds, a user who wrote reads
+# from the primary for the next DB_REPLICA_PIN_SECONDS.
+
+DB_REPLICAS = []
+for number, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+    DB_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['storeapi.routers.ReplicaRouter']
+DB_REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', 2))
+DB_REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# REDIS_URL shares the cache between all workers, otherwise it is per process.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a catalog response stays cached, 0 disables the catalog cache
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 300))
+
+# Users of the access tokens cached per process, for this many seconds
+AUTH_USER_CACHE_SIZE = int(os.environ.get('AUTH_USER_CACHE_SIZE', 1024))
+AUTH_USER_CACHE_TTL = int(os.environ.get('AUTH_USER_CACHE_TTL', 30))
+
+# Revoked tokens are read by every process at most every TOKEN_REVOCATION_REFRESH
+# seconds, all of them every TOKEN_REVOCATION_RELOAD seconds to drop the expired
+# ones. The Bloom filter of a process is sized for TOKEN_REVOCATION_CAPACITY tokens
+# and grows with them.
+TOKEN_REVOCATION_REFRESH = float(os.environ.get('TOKEN_REVOCATION_REFRESH', 2))
+TOKEN_REVOCATION_RELOAD = float(os.environ.get('TOKEN_REVOCATION_RELOAD', 60 * 60))
+TOKEN_REVOCATION_CAPACITY = int(os.environ.get('TOKEN_REVOCATION_CAPACITY', 10000))
+
+# Seconds the response of a request with an Idempotency-Key header is kept
+# for replay, clear_idempotency_keys deletes the older ones
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+# Threads per process running the queries of the async catalog views,
+# at most this many database connections are opened by them
+ASYNC_DB_THREADS = int(os.environ.get('ASYNC_DB_THREADS', 8))
+
+# Password hashing processes per worker (0 hashes in the request thread), the
+# passwords hashed or waiting at once per worker, and the seconds a request
+# waits for a slot before a 503
+PASSWORD_HASH_PROCESSES = int(os.environ.get('PASSWORD_HASH_PROCESSES', 1))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 4))
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 5))
+
+AUTHENTICATION_BACKENDS = [
+    'storeapi.authentication.PooledPasswordBackend',
+]
+
+# File holding the throttling buckets of the processes of a host, in memory
+# under /dev/shm, and the number of buckets in it
+THROTTLE_FILE = os.environ.get('THROTTLE_FILE', '/dev/shm/moviestore-throttle' if os.path.isdir('/dev/shm') else os.path.join(tempfile.gettempdir(), 'moviestore-throttle'))
+THROTTLE_SLOTS = int(os.environ.get('THROTTLE_SLOTS', 65536))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -131,11 +221,44 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Rental price tiers as (days, daily rate in EU), the last tier has no end
+RENTAL_PRICE_TIERS = (
+    (3, 1.0),
+    (None, 0.5),
+)
+
 REST_FRAMEWORK = {
 	'DEFAULT_FILTER_BACKENDS': (
 		'django_filters.rest_framework.DjangoFilterBackend',
 	),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'storeapi.authentication.CachedJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'storeapi.renderers.ORJSONRenderer',
+        'storeapi.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'storeapi.parsers.ORJSONParser',
+        'storeapi.parsers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
+    'DEFAULT_THROTTLE_CLASSES': (
+        'storeapi.throttling.UserTokenBucketThrottle',
+        'storeapi.throttling.IPTokenBucketThrottle',
+    ),
+    # per user (anonymous users by IP) for a scope, per IP for <scope>_ip
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': os.environ.get('THROTTLE_LOGIN_IP', '30/min'),
+        'rent': os.environ.get('THROTTLE_RENT', '30/min'),
+        'rent_ip': os.environ.get('THROTTLE_RENT_IP', '300/min'),
+        'title_search': os.environ.get('THROTTLE_TITLE_SEARCH', '60/min'),
+        'title_search_ip': os.environ.get('THROTTLE_TITLE_SEARCH_IP', '600/min'),
+    },
+    # proxies in front of the app adding X-Forwarded-For, with 0 the IP is the peer address
+    'NUM_PROXIES': int(os.environ.get('THROTTLE_NUM_PROXIES', 0)),
+    'DEFAULT_PAGINATION_CLASS': 'storeapi.pagination.LinkHeaderCursorPagination',
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', 100)),
 }
\ No newline at end of file
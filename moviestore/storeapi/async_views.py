@@ -0,0 +1,193 @@
+"""
+Async variants of the read heavy catalog endpoints, for ASGI servers.
+
+The ORM is synchronous, so every query runs in a bounded pool of database
+threads (settings.ASYNC_DB_THREADS) and the event loop only waits for it.
+Slow clients then cost a coroutine instead of a thread. The queries of a
+response (validators, rows, categories) run in one read only snapshot, so the
+ETag and Last-Modified match the body they are cached with. Responses are
+JSON, cached and validated like the synchronous views.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from .cache import catalog_cache_key
+from .conditional import conditional_response, validators
+from .db import prepare_connections, snapshot
+from .models import Category, Movie
+from .pagination import paginate
+from .renderers import ORJSONRenderer
+from .serializers import CategorySerializer, MovieRowSerializer
+from .throttling import check_throttles
+from .views import MovieList, filter_movies
+
+_executor = None
+
+
+def db_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.ASYNC_DB_THREADS, thread_name_prefix='storeapi-db')
+    return _executor
+
+
+def _call(function, *args):
+    # every call is a request as far as the connection of the pool thread is concerned
+    prepare_connections()
+    try:
+        return function(*args)
+    finally:
+        close_old_connections()
+
+
+async def run_in_db_thread(function, *args):
+    """
+    Run function(*args) in the database thread pool and return its result.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor(), functools.partial(_call, function, *args))
+
+
+def json_response(data, status=200, headers=None):
+    response = HttpResponse(ORJSONRenderer().render(data), status=status, content_type=ORJSONRenderer.media_type)
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+
+def api_exceptions(view):
+    """
+    Answer the DRF exceptions of an async view, like an invalid cursor, and
+    Http404 the way APIView does instead of with a server error.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        except (APIException, Http404) as exc:
+            # like the exception handler of DRF
+            if isinstance(exc, Http404):
+                exc = NotFound()
+            data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            headers = {'Retry-After': f'{int(exc.wait)}'} if getattr(exc, 'wait', None) else None
+            return json_response(data, status=exc.status_code, headers=headers)
+    return wrapper
+
+
+def catalog_request(request):
+    """
+    Wrap the request like APIView does, with JSON as the accepted media type
+    which the cache keys and ETags depend on. The user is authenticated on
+    first access, which may query the database.
+    """
+    request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    request.accepted_renderer = ORJSONRenderer()
+    request.accepted_media_type = ORJSONRenderer.media_type
+    return request
+
+
+def read_catalog(name, request, kwargs, validator_queryset, queries):
+    """
+    Return the validators and the query results of a catalog response, read
+    in one snapshot so they describe the same rows, and None for the results
+    when the validators answer the request with a 304.
+    """
+    with snapshot():
+        headers = validators(name, request, kwargs, validator_queryset)
+        if conditional_response(request, headers) is not None:
+            return headers, None
+        return headers, [query() for query in queries]
+
+
+async def catalog_response(name, request, kwargs, validator_queryset, *queries, build):
+    """
+    Return the response of a catalog view. The validators and the queries run
+    in one database thread, build(*results) returns the data and headers of
+    the response. Conditional requests are answered before the queries run.
+    """
+    key = None
+    if settings.CATALOG_CACHE_TIMEOUT:
+        key = await run_in_db_thread(catalog_cache_key, name, request, kwargs)
+        cached = await run_in_db_thread(cache.get, key)
+        if cached is not None:
+            data, headers = cached
+            return conditional_response(request, headers) or json_response(data, headers=headers)
+
+    headers, results = await run_in_db_thread(read_catalog, name, request, kwargs, validator_queryset, queries)
+    if results is None:
+        return conditional_response(request, headers)
+    data, extra_headers = build(*results)
+    headers = {**headers, **extra_headers}
+    if key is not None:
+        await run_in_db_thread(cache.set, key, (data, headers), settings.CATALOG_CACHE_TIMEOUT)
+    return json_response(data, headers=headers)
+
+
+@api_exceptions
+async def movie_list(request):
+    request = catalog_request(request)
+    # throttled like the title search of MovieList, per user when authenticated
+    if request.query_params.get('title'):
+        await run_in_db_thread(check_throttles, request, MovieList.throttle_scope)
+    queryset, ordering = filter_movies(request.query_params)
+    rows = MovieRowSerializer.setup_queryset(queryset, ordering)
+
+    def page():
+        return paginate(request, rows, MovieRowSerializer, ordering=ordering)
+
+    return await catalog_response('AsyncMovieList', request, {}, queryset, page, build=lambda page: page)
+
+
+@api_exceptions
+async def movie_detail(request, pk):
+    request = catalog_request(request)
+
+    def movie():
+        return Movie.objects.filter(pk=pk).values(*MovieRowSerializer.value_fields).first()
+
+    def categories():
+        through = Movie.category.through.objects.filter(movie_id=pk)
+        return list(through.order_by('category_id').values_list('category_id', flat=True))
+
+    def build(movie, categories):
+        if movie is None:
+            raise Http404
+        return {**movie, 'category': categories}, {}
+
+    return await catalog_response('AsyncMovieDetail', request, {'pk': pk}, Movie.objects.filter(pk=pk),
+                                  movie, categories, build=build)
+
+
+@api_exceptions
+async def category_list(request):
+    request = catalog_request(request)
+
+    def categories():
+        return list(Category.objects.values(*CategorySerializer.Meta.fields))
+
+    return await catalog_response('AsyncCategoryList', request, {}, Category.objects.all(),
+                                  categories, build=lambda categories: (categories, {}))
+
+
+@api_exceptions
+async def movie_list_by_category(request, pk):
+    request = catalog_request(request)
+    movies = Movie.objects.filter(pk__in=Movie.category.through.objects.filter(category=pk).values('movie_id'))
+
+    def page():
+        return paginate(request, MovieRowSerializer.setup_queryset(movies), MovieRowSerializer)
+
+    def build(exists, page):
+        if not exists:
+            raise Http404
+        return page
+
+    return await catalog_response('AsyncMovieListByCategory', request, {'pk': pk}, Movie.objects.filter(category=pk),
+                                  Category.objects.filter(pk=pk).exists, page, build=build)
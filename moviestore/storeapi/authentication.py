@@ -0,0 +1,110 @@
+"""
+JWT authentication with a per process cache of the token users.
+
+A valid access token names its user in the user id claim, the user row is
+then read at most once per AUTH_USER_CACHE_TTL seconds in every worker
+instead of on every request. Saving or deleting a user drops it from the
+cache of the worker that wrote it, the other workers see the change when
+their entry expires. Revoked tokens are rejected, see revocation.py.
+
+Passwords are checked in the process pool of hashing.py.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from . import hashing
+from .revocation import is_revoked
+
+
+class LRUCache:
+    """
+    Thread safe least recently used cache whose entries expire after ttl seconds.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+user_cache = LRUCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_TTL)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if is_revoked(validated_token):
+            raise InvalidToken('Token is revoked')
+        return validated_token
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        user = user_cache.get(user_id) if user_id is not None else None
+        if user is None:
+            # reads the user and rejects unknown and inactive users
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+        # views must not change the cached instance
+        return copy.copy(user)
+
+
+class PooledPasswordBackend(ModelBackend):
+    """
+    ModelBackend checking the passwords in the password hashing pool.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # hash anyway, like ModelBackend, so unknown users take as long
+            hashing.make_password(password)
+            return None
+        valid, must_update = hashing.check_password(password, user.password)
+        if not valid or not self.user_can_authenticate(user):
+            return None
+        if must_update:
+            user.password = hashing.make_password(password)
+            user.save(update_fields=['password'])
+        return user
@@ -0,0 +1,30 @@
+"""
+PostgreSQL backend with the health checks of storeapi.db.
+"""
+from django.db.backends.postgresql import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL connection checked before its first use in a request when it
+    was reused from a previous one, like CONN_HEALTH_CHECKS of Django 4.1.
+    """
+    # set to False at the start of a request for a reused connection
+    health_check_done = True
+
+    def close_if_health_check_failed(self):
+        if self.health_check_done or self.connection is None:
+            return
+        self.health_check_done = True
+        # a connection inside a transaction is never replaced
+        if not self.in_atomic_block and not self.is_usable():
+            self.close()
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
+
+    def set_autocommit(self, autocommit, force_begin_transaction_with_broken_autocommit=False):
+        # atomic() uses the connection before any cursor
+        self.close_if_health_check_failed()
+        return super().set_autocommit(autocommit, force_begin_transaction_with_broken_autocommit)
@@ -0,0 +1,69 @@
+"""
+Response cache for the movie catalog.
+
+Cached responses are keyed on the catalog version, bumping the version on any
+catalog write makes every cached response stale at once, in all workers. The
+responses are read from the primary before they are cached: a lagging replica
+would store the rows of before the write under the new version.
+"""
+import functools
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+from .conditional import conditional_response, normalized_request
+from .routers import primary_reads
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # start from the clock so a version lost by eviction is never reused
+        cache.add(CATALOG_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, int(time.time() * 1000), None)
+
+
+def catalog_cache_key(name, request, kwargs):
+    """
+    Return the cache key of a catalog view for the normalized query parameters
+    and the accepted media type, which the cached ETag depends on.
+    """
+    key = f'{normalized_request(request, kwargs)}:{request.accepted_media_type}'
+    digest = hashlib.md5(key.encode()).hexdigest()
+    return f'catalog:{get_catalog_version()}:{name}:{digest}'
+
+
+def catalog_cached(method):
+    """
+    Cache the successful responses of a catalog view method.
+    """
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        if not settings.CATALOG_CACHE_TIMEOUT:
+            return method(self, request, *args, **kwargs)
+        key = catalog_cache_key(type(self).__name__, request, kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            data, headers = cached
+            not_modified = conditional_response(request, headers)
+            if not_modified is not None:
+                return not_modified
+            return Response(data, headers=headers)
+        with primary_reads():
+            response = method(self, request, *args, **kwargs)
+        if response.status_code == 200:
+            headers = {name: value for name, value in response.items() if name != 'Content-Type'}
+            cache.set(key, (response.data, headers), settings.CATALOG_CACHE_TIMEOUT)
+        return response
+    return wrapper
@@ -0,0 +1,80 @@
+"""
+Conditional GET for catalog resources.
+
+The validators come from one aggregate query (row count and latest updated_at)
+over the rows a response is built from, so nothing is serialized to answer 304.
+"""
+import functools
+import hashlib
+from urllib.parse import urlencode
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+
+def normalized_request(request, kwargs):
+    """
+    Return the sorted non empty query parameters and url arguments as a query string.
+    """
+    params = sorted(
+        (key, value.strip())
+        for key, values in request.query_params.lists()
+        for value in values
+        if value.strip()
+    )
+    return urlencode(params + sorted(kwargs.items()))
+
+
+def validators(name, request, kwargs, queryset):
+    """
+    Return the ETag and Last-Modified headers for the rows of queryset.
+    """
+    aggregate = queryset.aggregate(count=Count('pk'), last_modified=Max('updated_at'))
+    last_modified = aggregate['last_modified']
+    key = ':'.join([
+        name,
+        normalized_request(request, kwargs),
+        str(request.accepted_media_type),
+        str(aggregate['count']),
+        last_modified.isoformat() if last_modified else '',
+    ])
+    headers = {'ETag': '"%s"' % hashlib.md5(key.encode()).hexdigest()}
+    if last_modified:
+        headers['Last-Modified'] = http_date(last_modified.timestamp())
+    return headers
+
+
+def conditional_response(request, headers):
+    """
+    Return a 304 (or 412) response when the request preconditions match the
+    ETag and Last-Modified headers, None when the full response has to be sent.
+    """
+    last_modified = headers.get('Last-Modified')
+    if last_modified:
+        last_modified = parse_http_date_safe(last_modified)
+    response = get_conditional_response(request, etag=headers.get('ETag'), last_modified=last_modified)
+    if response is not None:
+        for name in ('ETag', 'Last-Modified'):
+            if name in headers:
+                response[name] = headers[name]
+    return response
+
+
+def conditional_get(method):
+    """
+    Answer conditional requests of a view get method, the view provides the
+    rows of the response with validator_queryset(request, **kwargs).
+    """
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        queryset = self.validator_queryset(request, **kwargs)
+        headers = validators(type(self).__name__, request, kwargs, queryset)
+        not_modified = conditional_response(request, headers)
+        if not_modified is not None:
+            return not_modified
+        response = method(self, request, *args, **kwargs)
+        if response.status_code == 200:
+            for name, value in headers.items():
+                response[name] = value
+        return response
+    return wrapper
@@ -0,0 +1,74 @@
+"""
+Health checks of persistent database connections, read snapshots, and row
+iteration without server side cursors.
+
+Django 4.0 reuses a connection for CONN_MAX_AGE seconds but, unlike the
+CONN_HEALTH_CHECKS setting of later versions, does not check it first: a
+connection closed by the server or a pooler in the meantime fails the first
+query of the next request. With settings.DB_HEALTH_CHECKS a connection reused
+from a previous request is pinged once, before its first query in the
+request, and replaced when it is no longer usable. The check is done by the
+backend storeapi.backends.postgresql, a request that does not use a
+connection does not ping it.
+"""
+import contextlib
+from operator import attrgetter
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections, transaction
+
+
+def check_reused_connections():
+    """
+    Have the open connections checked before their next use.
+    """
+    if not settings.DB_HEALTH_CHECKS:
+        return
+    for conn in connections.all():
+        if conn.connection is not None:
+            conn.health_check_done = False
+
+
+def prepare_connections():
+    """
+    Close the obsolete connections and have the reused ones checked before a
+    unit of work, like Django does at the start of every request.
+    """
+    close_old_connections()
+    check_reused_connections()
+
+
+@contextlib.contextmanager
+def snapshot(using=DEFAULT_DB_ALIAS):
+    """
+    Run the queries of the block in one read only repeatable read transaction,
+    where every query sees the rows committed before the first one.
+    """
+    connection = connections[using]
+    if connection.in_atomic_block:
+        # the isolation level is set by the first query of a transaction
+        yield
+        return
+    with transaction.atomic(using=using):
+        with connection.cursor() as cursor:
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+        yield
+
+
+def iterate_rows(queryset, chunk_size, key=attrgetter('pk')):
+    """
+    Iterate over the rows of queryset in pk order, reading chunk_size rows at
+    a time with a server side cursor like QuerySet.iterator. Without server
+    side cursors (DB_POOLER), where QuerySet.iterator reads every row at once,
+    every chunk is read by its own query with pk greater than the key of the
+    last row read.
+    """
+    queryset = queryset.order_by('pk')
+    if not connections[queryset.db].settings_dict['DISABLE_SERVER_SIDE_CURSORS']:
+        yield from queryset.iterator(chunk_size=chunk_size)
+        return
+    rows = list(queryset[:chunk_size])
+    while rows:
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        rows = list(queryset.filter(pk__gt=key(rows[-1]))[:chunk_size])
@@ -0,0 +1,103 @@
+"""
+Password hashing in a process pool.
+
+Hashing a password (PBKDF2 with Django's iteration count) takes a core for a
+few hundred milliseconds. Login and signup hash in a pool of
+PASSWORD_HASH_PROCESSES processes per worker instead of the request thread,
+which caps the cores spent hashing during a login storm. At most
+PASSWORD_HASH_MAX_PENDING passwords are hashed or queued per worker, a request
+waiting more than PASSWORD_HASH_TIMEOUT seconds for a slot gets a 503 with a
+Retry-After header. PASSWORD_HASH_PROCESSES=0 hashes in the request thread.
+"""
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+_executor = None
+_slots = None
+_pid = None
+_lock = threading.Lock()
+
+
+class PasswordHashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many logins, try again later.'
+    default_code = 'password_hashing_busy'
+
+
+def _init_process():
+    import django
+    django.setup(set_prefix=False)
+
+
+def _make_password(password):
+    return hashers.make_password(password)
+
+
+def _check_password(password, encoded):
+    # the hasher settings may have changed since the password was hashed
+    must_update = []
+    valid = hashers.check_password(password, encoded, setter=lambda raw: must_update.append(True))
+    return valid, bool(must_update)
+
+
+def hash_executor():
+    """
+    Return the pool and the slots of this process, started at first use after
+    gunicorn has forked the worker.
+    """
+    global _executor, _slots, _pid
+    with _lock:
+        if _executor is None or _pid != os.getpid():
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_process,
+            )
+            _slots = threading.BoundedSemaphore(settings.PASSWORD_HASH_MAX_PENDING)
+            _pid = os.getpid()
+        return _executor, _slots
+
+
+def shutdown():
+    global _executor
+    with _lock:
+        if _executor is not None and _pid == os.getpid():
+            _executor.shutdown()
+        _executor = None
+
+
+def run_in_hash_process(function, *args):
+    if not settings.PASSWORD_HASH_PROCESSES:
+        return function(*args)
+    executor, slots = hash_executor()
+    if not slots.acquire(timeout=settings.PASSWORD_HASH_TIMEOUT):
+        exc = PasswordHashingBusy()
+        exc.wait = settings.PASSWORD_HASH_TIMEOUT
+        raise exc
+    try:
+        return executor.submit(function, *args).result()
+    except BrokenProcessPool:
+        # a killed process breaks the pool, the next call starts another one
+        shutdown()
+        raise
+    finally:
+        slots.release()
+
+
+def make_password(password):
+    return run_in_hash_process(_make_password, password)
+
+
+def check_password(password, encoded):
+    """
+    Return whether the password matches the encoded one and whether the
+    encoded one should be hashed again with the current hasher settings.
+    """
+    return run_in_hash_process(_check_password, password, encoded)
@@ -0,0 +1,55 @@
+"""
+Idempotency-Key support for write views.
+
+The first request with a key runs in a transaction that also stores its
+response, a retry with the same key gets the stored response back without
+running the view again. Concurrent requests with the same key wait for the
+first one on the unique index of the key.
+"""
+import functools
+import hashlib
+import json
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+
+def request_fingerprint(request, kwargs):
+    """
+    Return a digest of what the request asks for, a key sent again with a
+    different request is an error.
+    """
+    content = json.dumps([request.method, request.path, kwargs, request.data], sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def replay(stored, fingerprint):
+    if stored.fingerprint != fingerprint:
+        return Response(
+            {'detail': 'The Idempotency-Key was used for a different request.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(stored.response, status=stored.status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(method):
+    """
+    Make a view method idempotent for authenticated requests with an Idempotency-Key header.
+    """
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key or not request.user.is_authenticated:
+            return method(self, request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            return Response({'detail': 'The Idempotency-Key is too long.'}, status=status.HTTP_400_BAD_REQUEST)
+        fingerprint = request_fingerprint(request, kwargs)
+        with transaction.atomic():
+            claimed = IdempotencyKey.objects.claim(request.user, key, fingerprint)
+            if claimed is None:
+                return replay(IdempotencyKey.objects.get(user=request.user, key=key), fingerprint)
+            response = method(self, request, *args, **kwargs)
+            IdempotencyKey.objects.filter(pk=claimed).update(status_code=response.status_code, response=response.data)
+        return response
+    return wrapper
@@ -0,0 +1,64 @@
+"""
+Django command to compare the catalog list serializers.
+"""
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from storeapi.models import Category, Movie
+from storeapi.serializers import MovieSerializer, MovieRowSerializer
+
+class Command(BaseCommand):
+    """
+    Django command to compare MovieSerializer with the values based
+    MovieRowSerializer on a generated catalog. The generated rows are rolled back.
+    """
+    help = 'Benchmark the serialization of the movie list.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Number of movies.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per serializer, the best run is reported.')
+
+    def handle(self, *args, **options):
+        """
+        Handle the command.
+        """
+        rows = options['rows']
+        with transaction.atomic():
+            self.generate(rows)
+            movies = Movie.objects.order_by('id')
+            model_time, model_data = self.best(options['repeat'], lambda: MovieSerializer(
+                MovieSerializer.setup_eager_loading(movies), many=True).data)
+            rows_time, rows_data = self.best(options['repeat'], lambda: MovieRowSerializer(
+                MovieRowSerializer.setup_queryset(movies)).data)
+            transaction.set_rollback(True)
+
+        for movie in model_data:
+            movie['category'] = sorted(movie['category'])
+        if JSONRenderer().render(model_data) != JSONRenderer().render(rows_data):
+            self.stderr.write('The serializers returned different data.')
+        self.stdout.write(f'{rows} movies')
+        self.stdout.write(f'MovieSerializer:    {model_time * 1000:.1f} ms')
+        self.stdout.write(f'MovieRowSerializer: {rows_time * 1000:.1f} ms')
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {model_time / rows_time:.1f}x'))
+
+    def generate(self, rows):
+        categories = Category.objects.bulk_create(Category(name=f'Benchmark {i}') for i in range(20))
+        movies = Movie.objects.bulk_create(
+            Movie(title=f'Benchmark movie {i}', description='A generated movie. ' * 10, year=1950 + i % 70, imdb_rating=5 + i % 50 / 10)
+            for i in range(rows)
+        )
+        through = Movie.category.through
+        through.objects.bulk_create(
+            through(movie_id=movie.id, category_id=categories[(i + offset) % len(categories)].id)
+            for i, movie in enumerate(movies)
+            for offset in range(3)
+        )
+
+    def best(self, repeat, serialize):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            data = serialize()
+            timings.append(time.perf_counter() - started)
+        return min(timings), data
@@ -0,0 +1,57 @@
+"""
+Django command to compare the request latency with and without connection reuse.
+"""
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection
+from django.test.utils import override_settings
+from storeapi.models import Category
+
+class Command(BaseCommand):
+    """
+    Django command to compare the database time of a request with a new
+    connection per request (CONN_MAX_AGE 0), a persistent connection and a
+    persistent connection with health checks. Every request sends the request
+    signals Django uses to close and check connections and runs one query.
+    """
+    help = 'Benchmark the database time of a request with and without connection reuse.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per mode.')
+
+    def handle(self, *args, **options):
+        """
+        Handle the command.
+        """
+        modes = (
+            ('new connection', 0, False),
+            ('persistent', 600, False),
+            ('persistent + health check', 600, True),
+        )
+        conn_max_age = connection.settings_dict['CONN_MAX_AGE']
+        try:
+            for name, max_age, health_checks in modes:
+                connection.close()
+                connection.settings_dict['CONN_MAX_AGE'] = max_age
+                with override_settings(DB_HEALTH_CHECKS=health_checks):
+                    timings = self.run(options['requests'])
+                self.stdout.write(
+                    f'{name:<26} mean {statistics.mean(timings):6.2f} ms'
+                    f'  p50 {statistics.median(timings):6.2f} ms'
+                    f'  p95 {statistics.quantiles(timings, n=20)[-1]:6.2f} ms'
+                )
+        finally:
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+
+    def run(self, requests):
+        timings = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            request_started.send(sender=self.__class__)
+            list(Category.objects.values('id', 'name')[:10])
+            request_finished.send(sender=self.__class__)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
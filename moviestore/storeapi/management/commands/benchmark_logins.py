@@ -0,0 +1,106 @@
+"""
+Django command to measure the logins and the catalog latency during a login burst.
+"""
+import statistics
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.views import TokenObtainPairView
+from storeapi import hashing
+from storeapi.views import MovieList
+
+class Command(BaseCommand):
+    """
+    Django command to send a burst of logins from --concurrency threads while
+    another thread requests the movie list, with the passwords hashed in the
+    request threads and in the password hashing pool. Reports the logins per
+    second and the latency of the movie list, uncached, against its latency
+    without logins. The benchmark user is deleted afterwards.
+    """
+    help = 'Benchmark the logins and the catalog latency during a login burst.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=100, help='Logins per mode.')
+        parser.add_argument('--concurrency', type=int, default=16, help='Threads sending logins.')
+
+    def handle(self, *args, **options):
+        """
+        Handle the command.
+        """
+        self.factory = APIRequestFactory()
+        self.username = f'benchmark-{uuid.uuid4().hex[:8]}'
+        self.password = uuid.uuid4().hex
+        User.objects.create_user(username=self.username, password=self.password)
+        modes = (
+            ('request thread', 0),
+            ('process pool', max(settings.PASSWORD_HASH_PROCESSES, 1)),
+        )
+        try:
+            with override_settings(CATALOG_CACHE_TIMEOUT=0, ALLOWED_HOSTS=['testserver']):
+                idle = []
+                self.catalog_latencies(lambda: len(idle) >= 200, idle)
+                self.stdout.write(f'{"no logins":<16}' + ' ' * 33 + self.format(idle))
+                for name, processes in modes:
+                    hashing.shutdown()
+                    with override_settings(PASSWORD_HASH_PROCESSES=processes):
+                        # start the pool before timing
+                        hashing.make_password(self.password)
+                        self.run(name, options['logins'], options['concurrency'])
+        finally:
+            hashing.shutdown()
+            User.objects.filter(username=self.username).delete()
+
+    def run(self, name, logins, concurrency):
+        statuses = []
+        done = threading.Event()
+        catalog = []
+        catalog_thread = threading.Thread(target=self.catalog_latencies, args=(done.is_set, catalog))
+        login_threads = [
+            threading.Thread(target=self.login, args=(logins // concurrency + (i < logins % concurrency), statuses))
+            for i in range(concurrency)
+        ]
+        started = time.perf_counter()
+        catalog_thread.start()
+        for thread in login_threads:
+            thread.start()
+        for thread in login_threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        done.set()
+        catalog_thread.join()
+        succeeded = statuses.count(200)
+        self.stdout.write(
+            f'{name:<16}{succeeded / elapsed:7.1f} logins/s  {len(statuses) - succeeded:4d} rejected  '
+            + self.format(catalog)
+        )
+
+    def login(self, count, statuses):
+        try:
+            for _ in range(count):
+                request = self.factory.post('/token/', {'username': self.username, 'password': self.password}, format='json')
+                statuses.append(TokenObtainPairView.as_view()(request).status_code)
+        finally:
+            connection.close()
+
+    def catalog_latencies(self, stop, timings):
+        try:
+            while not stop():
+                started = time.perf_counter()
+                MovieList.as_view()(self.factory.get('/movies/')).render()
+                timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            connection.close()
+
+    def format(self, timings):
+        if len(timings) < 2:
+            return 'catalog: too few requests'
+        return (
+            f'catalog {len(timings):5d} requests  p50 {statistics.median(timings):7.2f} ms'
+            f'  p99 {statistics.quantiles(timings, n=100)[-1]:7.2f} ms'
+        )
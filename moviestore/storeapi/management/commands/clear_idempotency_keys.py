@@ -0,0 +1,19 @@
+"""
+Django command to delete the expired idempotency keys.
+"""
+from django.core.management.base import BaseCommand
+from storeapi.models import IdempotencyKey
+
+class Command(BaseCommand):
+    """
+    Django command to delete the idempotency keys older than
+    settings.IDEMPOTENCY_KEY_TTL, to be run periodically.
+    """
+    help = 'Delete the expired idempotency keys.'
+
+    def handle(self, *args, **options):
+        """
+        Handle the command.
+        """
+        deleted, _ = IdempotencyKey.objects.expired().delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency keys.'))
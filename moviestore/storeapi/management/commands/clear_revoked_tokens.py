@@ -0,0 +1,19 @@
+"""
+Django command to delete the revoked tokens that have expired.
+"""
+from django.core.management.base import BaseCommand
+from storeapi.models import RevokedToken
+
+class Command(BaseCommand):
+    """
+    Django command to delete the revoked tokens past their expiry, that are
+    rejected anyway, to be run periodically.
+    """
+    help = 'Delete the expired revoked tokens.'
+
+    def handle(self, *args, **options):
+        """
+        Handle the command.
+        """
+        deleted, _ = RevokedToken.objects.expired().delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired revoked tokens.'))
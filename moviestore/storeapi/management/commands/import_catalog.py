@@ -0,0 +1,125 @@
+"""
+Django command to import movies and categories from IMDb style TSV dumps.
+"""
+import gzip
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from storeapi.cache import bump_catalog_version
+from storeapi.models import Category, Movie
+
+# IMDb dumps are tab separated, unquoted, with \N for missing values
+COPY_OPTIONS = "FORMAT csv, DELIMITER E'\\t', QUOTE E'\\x01', NULL '\\N', HEADER true"
+
+SEARCH_VECTOR_SQL = """
+    setweight(to_tsvector('english'::regconfig, COALESCE({title}, '')), 'A') ||
+    setweight(to_tsvector('english'::regconfig, COALESCE({description}, '')), 'B')
+"""
+
+class Command(BaseCommand):
+    """
+    Django command to import movies and categories from IMDb style TSV dumps
+    (title.basics and optionally title.ratings, plain or gzipped).
+    The files are loaded with COPY into temporary staging tables and merged
+    into the catalog with set based statements, movies are upserted on their
+    IMDb id so the import can be run again with newer dumps.
+    """
+    help = 'Import movies and categories from IMDb style TSV dumps.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('basics', help='title.basics TSV file (tconst, titleType, primaryTitle, ..., genres).')
+        parser.add_argument('--ratings', help='title.ratings TSV file (tconst, averageRating, numVotes).')
+        parser.add_argument('--title-types', default='movie',
+                            help='Comma separated title types to import.')
+
+    def handle(self, *args, **options):
+        """
+        Handle the command.
+        """
+        started = time.monotonic()
+        title_types = [t.strip() for t in options['title_types'].split(',') if t.strip()]
+        movie_table = Movie._meta.db_table
+        category_table = Category._meta.db_table
+        through_table = Movie.category.through._meta.db_table
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS pg_temp.import_basics, pg_temp.import_ratings')
+            cursor.execute("""
+                CREATE TEMP TABLE import_basics (
+                    tconst text, title_type text, primary_title text, original_title text,
+                    is_adult text, start_year text, end_year text, runtime_minutes text, genres text
+                )
+            """)
+            cursor.execute("""
+                CREATE TEMP TABLE import_ratings (
+                    tconst text PRIMARY KEY, average_rating double precision, num_votes integer
+                )
+            """)
+            self.copy(cursor, 'import_basics', options['basics'])
+            if options['ratings']:
+                self.copy(cursor, 'import_ratings', options['ratings'])
+            self.stdout.write(f'Staged files in {time.monotonic() - started:.1f}s')
+
+            cursor.execute(f"""
+                INSERT INTO {movie_table} (imdb_id, title, description, year, imdb_rating, created_at, updated_at, search_vector)
+                SELECT b.tconst, left(b.primary_title, 100), '', COALESCE(b.start_year::integer, 0),
+                       COALESCE(r.average_rating, 0), now(), now(),
+                       {SEARCH_VECTOR_SQL.format(title='left(b.primary_title, 100)', description="''")}
+                FROM import_basics b
+                LEFT JOIN import_ratings r ON r.tconst = b.tconst
+                WHERE b.title_type = ANY(%s)
+                ON CONFLICT (imdb_id) DO UPDATE SET
+                    title = EXCLUDED.title,
+                    year = EXCLUDED.year,
+                    imdb_rating = EXCLUDED.imdb_rating,
+                    updated_at = now(),
+                    search_vector = {SEARCH_VECTOR_SQL.format(title='EXCLUDED.title', description=f'{movie_table}.description')}
+                WHERE ({movie_table}.title, {movie_table}.year, {movie_table}.imdb_rating)
+                    IS DISTINCT FROM (EXCLUDED.title, EXCLUDED.year, EXCLUDED.imdb_rating)
+            """, [title_types])
+            movies = cursor.rowcount
+
+            cursor.execute(f"""
+                INSERT INTO {category_table} (name, updated_at)
+                SELECT DISTINCT genre, now()
+                FROM import_basics b, unnest(string_to_array(b.genres, ',')) AS genre
+                WHERE b.title_type = ANY(%s)
+                  AND NOT EXISTS (SELECT 1 FROM {category_table} c WHERE c.name = genre)
+            """, [title_types])
+            categories = cursor.rowcount
+
+            # the categories are part of a movie, touch the movies given new ones
+            cursor.execute(f"""
+                WITH links AS (
+                    INSERT INTO {through_table} (movie_id, category_id)
+                    SELECT m.id, c.id
+                    FROM import_basics b
+                    JOIN {movie_table} m ON m.imdb_id = b.tconst
+                    CROSS JOIN unnest(string_to_array(b.genres, ',')) AS genre
+                    JOIN (SELECT min(id) AS id, name FROM {category_table} GROUP BY name) c ON c.name = genre
+                    WHERE b.title_type = ANY(%s)
+                    ON CONFLICT DO NOTHING
+                    RETURNING movie_id
+                ), touched AS (
+                    UPDATE {movie_table} SET updated_at = now()
+                    WHERE id IN (SELECT movie_id FROM links)
+                )
+                SELECT count(*) FROM links
+            """, [title_types])
+            links = cursor.fetchone()[0]
+            cursor.execute('DROP TABLE pg_temp.import_basics, pg_temp.import_ratings')
+
+        # bulk statements send no signals
+        bump_catalog_version()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {movies} movies, {categories} new categories, {links} new movie categories in {elapsed:.1f}s'
+        ))
+
+    def copy(self, cursor, table, path):
+        try:
+            f = gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+        except OSError as exc:
+            raise CommandError(f'Cannot open {path}: {exc}')
+        with f:
+            cursor.copy_expert(f'COPY {table} FROM STDIN WITH ({COPY_OPTIONS})', f)
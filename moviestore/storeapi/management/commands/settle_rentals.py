@@ -0,0 +1,88 @@
+"""
+Django command to recompute and store the price of all open rentals.
+"""
+import os
+import time
+from django.core.management.base import BaseCommand
+from django.db.models import Case, FloatField, Value, When
+from django.utils import timezone
+from storeapi.db import iterate_rows
+from storeapi.models import Rental
+from storeapi.pricing import default_pricing, rental_days
+
+class Command(BaseCommand):
+    """
+    Django command to recompute and store the price of all open rentals.
+    Rentals are streamed in id order and written in chunks, each chunk with one
+    statement, so an interrupted run can resume after the last chunk.
+    """
+    help = 'Recompute and store the price of all open rentals.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of rentals written per transaction.')
+        parser.add_argument('--after-id', type=int, default=0,
+                            help='Only settle rentals with a greater id.')
+        parser.add_argument('--checkpoint',
+                            help='File keeping the last settled id, used to resume an interrupted run.')
+
+    def handle(self, *args, **options):
+        """
+        Handle the command.
+        """
+        chunk_size = options['chunk_size']
+        checkpoint = options['checkpoint']
+        after_id = options['after_id']
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                after_id = max(after_id, int(f.read().strip() or 0))
+            self.stdout.write(f'Resuming after rental {after_id}')
+
+        pricing = default_pricing()
+        now = timezone.now()
+        rentals = (
+            Rental.objects.filter(activated=False, pk__gt=after_id)
+            .order_by('id')
+            .only('id', 'rented_at', 'price')
+        )
+        started = time.monotonic()
+        seen = updated = 0
+        chunk = []
+        for rental in iterate_rows(rentals, chunk_size):
+            chunk.append(rental)
+            if len(chunk) == chunk_size:
+                updated += self.settle(chunk, pricing, now, checkpoint)
+                seen += len(chunk)
+                self.report(seen, updated, started)
+                chunk = []
+        if chunk:
+            updated += self.settle(chunk, pricing, now, checkpoint)
+            seen += len(chunk)
+            self.report(seen, updated, started)
+
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS(f'Settled {seen} rentals, {updated} prices changed.'))
+
+    def settle(self, chunk, pricing, now, checkpoint):
+        """
+        Store the price of a chunk of rentals, return the number of changed rows.
+        """
+        prices = pricing.quote(rental_days([rental.rented_at for rental in chunk], now))
+        changed = {rental.pk: float(price) for rental, price in zip(chunk, prices) if rental.price != price}
+        updated = 0
+        if changed:
+            # a rental paid since it was read keeps the price it was paid at
+            updated = Rental.objects.filter(pk__in=changed, activated=False).update(
+                price=Case(*(When(pk=pk, then=Value(price)) for pk, price in changed.items()), output_field=FloatField()),
+                updated_at=timezone.now(),
+            )
+        if checkpoint:
+            with open(checkpoint, 'w') as f:
+                f.write(str(chunk[-1].pk))
+        return updated
+
+    def report(self, seen, updated, started):
+        elapsed = time.monotonic() - started
+        rate = seen / elapsed if elapsed else 0
+        self.stdout.write(f'{seen} rentals settled ({updated} changed), {rate:.0f} rentals/s')
@@ -0,0 +1,32 @@
+# Generated by Django 4.0 on 2026-10-18 13:14
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storeapi', '0008_alter_rental_rented_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='movie_search_vector_idx'),
+        ),
+        migrations.RunSQL(
+            sql="""
+            UPDATE storeapi_movie SET search_vector =
+                setweight(to_tsvector('english'::regconfig, COALESCE(title, '')), 'A') ||
+                setweight(to_tsvector('english'::regconfig, COALESCE(description, '')), 'B');
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
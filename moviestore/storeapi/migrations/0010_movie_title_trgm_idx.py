@@ -0,0 +1,20 @@
+# Generated by Django 4.0 on 2026-10-18 13:15
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storeapi', '0009_movie_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='movie',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='movie_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
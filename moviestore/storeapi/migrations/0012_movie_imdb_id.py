@@ -0,0 +1,18 @@
+# Generated by Django 4.0 on 2026-10-18 13:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storeapi', '0011_category_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='imdb_id',
+            field=models.CharField(blank=True, max_length=20, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.0 on 2026-10-18 13:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storeapi', '0012_movie_imdb_id'),
+    ]
+
+    operations = [
+        # keep the oldest of duplicated open rentals, created by concurrent rent requests
+        migrations.RunSQL(
+            """
+            DELETE FROM storeapi_rental r
+            USING storeapi_rental older
+            WHERE NOT r.activated AND NOT older.activated
+              AND r.user_id = older.user_id AND r.movie_id = older.movie_id
+              AND r.id > older.id
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='rental',
+            constraint=models.UniqueConstraint(condition=models.Q(('activated', False)), fields=('user', 'movie'), name='rental_open_user_movie_unique'),
+        ),
+    ]
@@ -1,10 +1,39 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from django.utils import timezone
-from django.db import models
+from django.db import connection, connections, models
+from django.db.models.functions import ExtractDay, Now, TruncDate
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from .pricing import default_pricing
+
+# weighted document used for full text search on movies
+MOVIE_SEARCH_VECTOR = (
+    SearchVector('title', weight='A', config='english')
+    + SearchVector('description', weight='B', config='english')
+)
+
+class MovieQuerySet(models.QuerySet):
+
+    def delete_with_rentals(self):
+        """
+        Delete the movies with their category links, rentals and payments in
+        five statements, where QuerySet.delete deletes them 100 at a time and
+        sends post_delete, and bumps the catalog version, once per movie. No
+        delete signals are sent, the caller bumps the catalog version. Return
+        the number of movies deleted.
+        """
+        Rental.objects.filter(movie__in=self).delete_with_payments()
+        Movie.category.through.objects.filter(movie__in=self).delete()
+        query, params = self.values('pk').query.sql_with_params()
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.model._meta.db_table} WHERE id IN ({query})', params)
+            return cursor.rowcount
 
 # Create your models here.
 class Movie(models.Model):
+    imdb_id = models.CharField(max_length=20, unique=True, null=True, blank=True)
     title = models.CharField(max_length=100)
     description = models.TextField()
     year = models.IntegerField()
@@ -12,16 +41,78 @@ class Movie(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     category = models.ManyToManyField('Category', related_name='movies')
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = MovieQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='movie_search_vector_idx'),
+            GinIndex(fields=['title'], name='movie_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'title', 'description'} & set(update_fields):
+            # keep the search document in sync with title and description
+            Movie.objects.filter(pk=self.pk).update(search_vector=MOVIE_SEARCH_VECTOR)
+
 class Category(models.Model):
     name = models.CharField(max_length=100)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+class RentalQuerySet(models.QuerySet):
+
+    def with_price(self):
+        """
+        Annotate current_price, the amount due today computed by the database
+        with the configured price tiers, or the amount paid for a paid rental.
+        """
+        days = ExtractDay(TruncDate(Now()) - TruncDate('rented_at'))
+        return self.annotate(current_price=models.Case(
+            models.When(activated=True, then=models.F('price')),
+            default=default_pricing().expression(days),
+            output_field=models.FloatField(),
+        ))
+
+    def rent(self, user, movie_id):
+        """
+        Open a rental of the movie for the user in one statement. Return the
+        id of the new rental, or None when the movie does not exist or the user
+        already has an open rental of it, which the database guarantees.
+        """
+        rental = self.model(user=user, movie_id=movie_id)
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {self.model._meta.db_table} (movie_id, user_id, rented_at, updated_at, activated, price)
+                SELECT m.id, %s, %s, %s, false, %s FROM {Movie._meta.db_table} m WHERE m.id = %s
+                ON CONFLICT (user_id, movie_id) WHERE NOT activated DO NOTHING
+                RETURNING id
+            """, [user.pk, rental.rented_at, timezone.now(), rental.price, movie_id])
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def delete_with_payments(self):
+        """
+        Delete the rentals and their payments in two statements, where
+        QuerySet.delete loads the rentals and deletes them 100 at a time.
+        Payment is the only model referencing a rental, and no receiver
+        listens to their delete signals, which are not sent. Return the
+        number of rentals deleted.
+        """
+        Payment.objects.filter(rental__in=self).delete()
+        query, params = self.values('pk').query.sql_with_params()
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.model._meta.db_table} WHERE id IN ({query})', params)
+            return cursor.rowcount
+
 class Rental(models.Model):
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -30,6 +121,16 @@ class Rental(models.Model):
     activated = models.BooleanField(default=False)
     price = models.FloatField(default=1.0)
 
+    objects = RentalQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # a user has at most one open rental of a movie
+            models.UniqueConstraint(
+                fields=['user', 'movie'], condition=models.Q(activated=False), name='rental_open_user_movie_unique',
+            ),
+        ]
+
     def __str__(self):
         return f'{self.movie} - {self.customer}'
 
@@ -40,4 +141,88 @@ class Payment(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f'{self.rental} - {self.amount}'
\ No newline at end of file
+        return f'{self.rental} - {self.amount}'
+class IdempotencyKeyQuerySet(models.QuerySet):
+
+    def expired(self):
+        return self.filter(created_at__lt=timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL))
+
+    def claim(self, user, key, fingerprint):
+        """
+        Insert the key of a request, or take over an expired one, in one statement.
+        Return its id, or None when the key is in use: the statement waits
+        for a concurrent request with the same key to finish.
+        """
+        now = timezone.now()
+        table = self.model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {table} (user_id, key, fingerprint, status_code, response, created_at)
+                VALUES (%s, %s, %s, NULL, NULL, %s)
+                ON CONFLICT (user_id, key) DO UPDATE SET
+                    fingerprint = EXCLUDED.fingerprint, status_code = NULL, response = NULL, created_at = EXCLUDED.created_at
+                WHERE {table}.created_at < %s
+                RETURNING id
+            """, [user.pk, key, fingerprint, now, now - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)])
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+class IdempotencyKey(models.Model):
+    """
+    The response of a request sent with an Idempotency-Key header, replayed
+    when the request is retried with the same key.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    objects = IdempotencyKeyQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_key_user_key_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} - {self.key}'
+
+class RevokedTokenQuerySet(models.QuerySet):
+
+    def expired(self):
+        return self.filter(expires_at__lt=timezone.now())
+
+    def active(self):
+        return self.filter(expires_at__gte=timezone.now())
+
+    def revoke(self, tokens):
+        """
+        Insert the (jti, expires_at) pairs of revoked tokens, skipping the
+        ones already revoked. created_at is set by the database clock, that
+        every process compares it against.
+        """
+        if not tokens:
+            return
+        table = self.model._meta.db_table
+        values = ', '.join(['(%s, %s, clock_timestamp())'] * len(tokens))
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {table} (jti, expires_at, created_at)
+                VALUES {values}
+                ON CONFLICT (jti) DO NOTHING
+            """, [value for token in tokens for value in token])
+
+class RevokedToken(models.Model):
+    """
+    The id (jti claim) of a revoked token, kept until the token expires.
+    """
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    objects = RevokedTokenQuerySet.as_manager()
+
+    def __str__(self):
+        return self.jti
@@ -0,0 +1,85 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class LinkHeaderMixin:
+
+    def get_link_headers(self):
+        links = []
+        next_url = self.get_next_link()
+        previous_url = self.get_previous_link()
+        if next_url is not None:
+            links.append(f'<{next_url}>; rel="next"')
+        if previous_url is not None:
+            links.append(f'<{previous_url}>; rel="prev"')
+        return {'Link': ', '.join(links)} if links else {}
+
+    def get_paginated_response(self, data):
+        return Response(data, headers=self.get_link_headers() or None)
+
+
+class LinkHeaderCursorPagination(LinkHeaderMixin, CursorPagination):
+    """
+    Keyset pagination over the primary key.
+    The response body stays a plain list, the opaque next/prev cursors
+    are sent in the Link header (RFC 8288).
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class LinkHeaderOffsetPagination(LinkHeaderMixin, LimitOffsetPagination):
+    """
+    Offset pagination with the page_size parameter and Link headers of the
+    cursor pagination, for orderings a cursor can't hold. Reads one row past
+    the page instead of counting the rows.
+    """
+    limit_query_param = 'page_size'
+    max_limit = 500
+
+    @property
+    def default_limit(self):
+        return api_settings.PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.offset = self.get_offset(request)
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        return rows[:self.limit]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.offset_query_param, self.offset + self.limit)
+
+
+def paginate(request, queryset, serializer_class, view=None, ordering=None):
+    """
+    Return the serialized data of one page of the queryset and its Link headers.
+    The ordering must end with a unique field, defaults to id. A cursor holds
+    only the first field of the ordering, so orderings not led by id, like
+    the rank of a search whose ties would repeat pages, are paginated by offset.
+    """
+    if ordering and ordering[0].lstrip('-') != 'id':
+        paginator = LinkHeaderOffsetPagination()
+        queryset = queryset.order_by(*ordering)
+    else:
+        paginator = LinkHeaderCursorPagination()
+        if ordering:
+            paginator.ordering = ordering
+    page = paginator.paginate_queryset(queryset, request, view=view)
+    serializer = serializer_class(page, many=True)
+    return serializer.data, paginator.get_link_headers()
+
+
+def paginated_response(request, queryset, serializer_class, view=None, ordering=None):
+    """
+    Return one page of the queryset serialized with serializer_class.
+    """
+    data, headers = paginate(request, queryset, serializer_class, view, ordering)
+    return Response(data, headers=headers or None)
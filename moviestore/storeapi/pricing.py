@@ -0,0 +1,62 @@
+"""
+Tiered rental pricing.
+
+A rental is charged per day, at least one day. The tiers are configured in
+settings.RENTAL_PRICE_TIERS as (days, rate) pairs: each tier charges its daily
+rate for the days that fall into it, the last tier has days None.
+"""
+import numpy as np
+from django.conf import settings
+from django.db.models import ExpressionWrapper, FloatField, Value
+from django.db.models.functions import Greatest, Least
+
+
+class TierPricing:
+
+    def __init__(self, tiers):
+        # (first day, length, rate) for every tier
+        self.tiers = []
+        start = 0
+        for days, rate in tiers:
+            self.tiers.append((start, days, float(rate)))
+            if days is None:
+                break
+            start += days
+
+    def quote(self, days):
+        """
+        Return an array with the price of every element of an array of rental days.
+        """
+        billable = np.maximum(np.asarray(days, dtype=np.int64), 1)
+        prices = np.zeros(billable.shape, dtype=np.float64)
+        for start, length, rate in self.tiers:
+            in_tier = billable - start
+            if length is not None:
+                in_tier = np.minimum(in_tier, length)
+            prices += np.maximum(in_tier, 0) * rate
+        return prices
+
+    def expression(self, days):
+        """
+        Return a database expression of the price for a rental days expression.
+        """
+        billable = Greatest(days, Value(1))
+        price = Value(0.0)
+        for start, length, rate in self.tiers:
+            in_tier = billable - Value(start)
+            if length is not None:
+                in_tier = Least(in_tier, Value(length))
+            price = price + ExpressionWrapper(Greatest(in_tier, Value(0)) * Value(rate), output_field=FloatField())
+        return ExpressionWrapper(price, output_field=FloatField())
+
+
+def default_pricing():
+    return TierPricing(settings.RENTAL_PRICE_TIERS)
+
+
+def rental_days(rented_at, now):
+    """
+    Return an array with the number of days since every rented_at datetime.
+    """
+    dates = np.array([value.date() for value in rented_at], dtype='datetime64[D]')
+    return (np.datetime64(now.date(), 'D') - dates).astype(np.int64)
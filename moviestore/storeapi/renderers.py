@@ -0,0 +1,104 @@
+import csv
+import datetime
+import msgpack
+import orjson
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def encode_default(obj):
+    """
+    Encode the types orjson and msgpack do not know (lazy strings, Decimal,
+    querysets...) the way the stock JSON renderer of DRF does.
+    """
+    return JSONEncoder().default(obj)
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    JSON renderer backed by orjson.
+    """
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return orjson.dumps(data, default=encode_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack renderer for service to service clients.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default, use_bin_type=True)
+
+
+class ExportRenderer(BaseRenderer):
+    """
+    Base of the export formats. Exports are streamed with stream(), render()
+    only serves error responses.
+    """
+    charset = None
+    # rows encoded per chunk sent to the client
+    chunk_rows = 500
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return orjson.dumps(data, default=encode_default)
+
+    def stream(self, fields, rows):
+        """
+        Yield the encoded rows (tuples of values of fields) in chunks.
+        """
+        chunk = [self.header(fields)]
+        for row in rows:
+            chunk.append(self.encode(fields, row))
+            if len(chunk) >= self.chunk_rows:
+                yield b''.join(chunk)
+                chunk = []
+        if chunk:
+            yield b''.join(chunk)
+
+    def header(self, fields):
+        return b''
+
+
+class NDJSONRenderer(ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def encode(self, fields, row):
+        return orjson.dumps(dict(zip(fields, row)), default=encode_default) + b'\n'
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    class Line:
+        """
+        File like object returning what csv.writer writes.
+        """
+        def write(self, value):
+            return value
+
+    def __init__(self):
+        self.writer = csv.writer(self.Line())
+
+    def header(self, fields):
+        return self.writer.writerow(fields).encode()
+
+    def encode(self, fields, row):
+        values = [value.isoformat() if isinstance(value, datetime.datetime) else value for value in row]
+        return self.writer.writerow(values).encode()
@@ -0,0 +1,157 @@
+"""
+Revoked tokens.
+
+Revoking a token stores its jti in the RevokedToken table until the token
+expires. Every process keeps the revoked jtis in memory: a Bloom filter that
+answers most checks, the ones of tokens never revoked, and the exact set for
+the jtis it may hold. The memory is refreshed at most every
+TOKEN_REVOCATION_REFRESH seconds with the rows created since the last refresh,
+so a revocation reaches every worker within that time and a request checks its
+token without a query.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from rest_framework_simplejwt.settings import api_settings
+from .models import RevokedToken
+
+logger = logging.getLogger(__name__)
+
+# rows committed after a later row are read again by the next refreshes
+REFRESH_OVERLAP = timedelta(seconds=10)
+
+
+class BloomFilter:
+    """
+    Set of strings answering membership with false positives, at about
+    error_rate while it holds at most capacity items, and no false negatives.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(capacity, 1)
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+
+class RevocationList:
+    """
+    The revoked jtis known to this process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.bloom = BloomFilter(settings.TOKEN_REVOCATION_CAPACITY)
+        self.jtis = set()
+        # created_at of the newest row read, by the database clock
+        self.since = None
+        self.refreshed_at = None
+        self.loaded_at = None
+
+    def add(self, jti):
+        # the filter first, a jti in the set is always in the filter
+        if jti not in self.jtis:
+            self.bloom.add(jti)
+            self.jtis.add(jti)
+
+    def is_revoked(self, jti):
+        self.refresh_if_stale()
+        return jti in self.bloom and jti in self.jtis
+
+    def refresh_if_stale(self):
+        now = time.monotonic()
+        if self.refreshed_at is not None and now - self.refreshed_at < settings.TOKEN_REVOCATION_REFRESH:
+            return
+        # until the first load every thread waits for it, then one refreshes
+        # while the others keep checking against the current list
+        if not self.lock.acquire(blocking=self.refreshed_at is None):
+            return
+        try:
+            if self.refreshed_at is None or now - self.refreshed_at >= settings.TOKEN_REVOCATION_REFRESH:
+                self.refresh()
+        finally:
+            self.lock.release()
+
+    def refresh(self):
+        """
+        Read the rows created since the last refresh, or every unexpired row
+        once every TOKEN_REVOCATION_RELOAD seconds to forget the expired ones
+        and when the filter is over its capacity.
+        """
+        now = time.monotonic()
+        reload = (
+            self.loaded_at is None
+            or now - self.loaded_at >= settings.TOKEN_REVOCATION_RELOAD
+            or self.bloom.count > self.bloom.capacity
+        )
+        queryset = RevokedToken.objects.active()
+        if not reload and self.since is not None:
+            queryset = queryset.filter(created_at__gte=self.since - REFRESH_OVERLAP)
+        try:
+            rows = list(queryset.values_list('jti', 'created_at'))
+        except DatabaseError:
+            # keep the current list and try again after the refresh interval
+            logger.exception('Could not refresh the revoked tokens')
+            self.refreshed_at = now
+            return
+        if reload:
+            bloom = BloomFilter(max(settings.TOKEN_REVOCATION_CAPACITY, 2 * len(rows)))
+            jtis = set()
+            for jti, _ in rows:
+                bloom.add(jti)
+                jtis.add(jti)
+            # swap both at once, the jtis revoked by this process meanwhile are
+            # read again by the next refresh
+            self.bloom, self.jtis = bloom, jtis
+            self.loaded_at = now
+        else:
+            for jti, _ in rows:
+                self.add(jti)
+        if rows:
+            newest = max(created_at for _, created_at in rows)
+            self.since = newest if self.since is None else max(self.since, newest)
+        self.refreshed_at = now
+
+
+revocation_list = RevocationList()
+
+
+def is_revoked(token):
+    return revocation_list.is_revoked(token.get(api_settings.JTI_CLAIM))
+
+
+def revoke(*tokens):
+    """
+    Revoke tokens, at once in this process and within TOKEN_REVOCATION_REFRESH
+    seconds in the others.
+    """
+    rows = [
+        (token[api_settings.JTI_CLAIM], datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc))
+        for token in tokens
+    ]
+    RevokedToken.objects.revoke(rows)
+    for jti, _ in rows:
+        transaction.on_commit(lambda jti=jti: revocation_list.add(jti))
@@ -0,0 +1,146 @@
+"""
+Read replicas.
+
+The views marked with replica_reads read from a replica in settings.DB_REPLICAS
+(DB_REPLICA_HOSTS), everything else reads and writes the primary. A replica
+lagging more than DB_REPLICA_MAX_LAG seconds is skipped, and a user who has
+just written is pinned to the primary for DB_REPLICA_PIN_SECONDS so they read
+their own writes.
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+import random
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.decorators import sync_and_async_middleware
+
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+# alias -> (checked at, lag in seconds), per process
+_lags = {}
+LAG_CHECK_INTERVAL = 1.0
+
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def replica_lag(alias):
+    """
+    Return the replication lag of a replica in seconds, infinite when it is unreachable.
+    """
+    checked_at, lag = _lags.get(alias, (None, None))
+    now = time.monotonic()
+    if checked_at is None or now - checked_at > LAG_CHECK_INTERVAL:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                lag = float(cursor.fetchone()[0])
+        except DatabaseError:
+            connections[alias].close()
+            lag = float('inf')
+        _lags[alias] = (now, lag)
+    return lag
+
+
+def available_replicas():
+    return [alias for alias in settings.DB_REPLICAS if replica_lag(alias) <= settings.DB_REPLICA_MAX_LAG]
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        # a transaction reads its own writes on the primary
+        if _replica_reads.get() and settings.DB_REPLICAS and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            replicas = available_replicas()
+            if replicas:
+                return random.choice(replicas)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def pin_key(user):
+    return f'replica:pin:{user.pk}'
+
+
+def pin_to_primary(user):
+    cache.set(pin_key(user), 1, settings.DB_REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user):
+    return user.is_authenticated and cache.get(pin_key(user)) is not None
+
+
+def replica_reads(method):
+    """
+    Read from a replica in a view method, unless the user is pinned to the primary.
+    """
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        if not settings.DB_REPLICAS or is_pinned(request.user):
+            return method(self, request, *args, **kwargs)
+        token = _replica_reads.set(True)
+        try:
+            return method(self, request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+    return wrapper
+
+
+@contextlib.contextmanager
+def primary_reads():
+    """
+    Read from the primary, inside a view marked with replica_reads.
+    """
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def pin_after_write(request, response):
+    if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+        user = getattr(request, 'user', None)
+        if settings.DB_REPLICAS and user is not None and user.is_authenticated:
+            pin_to_primary(user)
+
+
+@sync_and_async_middleware
+def primary_pin_middleware(get_response):
+    """
+    Pin a user to the primary after a successful write request. The middleware
+    is async under ASGI, where a sync one would hold a thread for the whole
+    request of an async view.
+    """
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            response = await get_response(request)
+            if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+                # the lazy user and the cache are synchronous
+                await sync_to_async(pin_after_write)(request, response)
+            return response
+    else:
+        def middleware(request):
+            response = get_response(request)
+            pin_after_write(request, response)
+            return response
+    return middleware
@@ -1,6 +1,15 @@
 from rest_framework import serializers
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db.models import Q
 from django.contrib.auth.models import User
-from .models import Movie, Category, Rental, Payment
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer as JWTTokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from .models import Movie, Category, Rental, Payment, MOVIE_SEARCH_VECTOR
+from .hashing import make_password
+from .revocation import is_revoked
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -14,19 +23,199 @@ class MovieSerializer(serializers.ModelSerializer):
         model = Movie
         fields = ('id', 'title', 'description', 'year', 'imdb_rating', 'category')
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        # fetch the category ids of all movies in one query
+        return queryset.prefetch_related('category')
+
+
+class MovieRowSerializer:
+    """
+    Read only fast path of MovieSerializer for lists. It builds the same
+    representation from .values() rows with the category ids aggregated by
+    the database, without model instances or serializer fields.
+    """
+    value_fields = ('id', 'title', 'description', 'year', 'imdb_rating')
+
+    def __init__(self, instance, many=True):
+        self.instance = instance
+
+    @classmethod
+    def setup_queryset(cls, queryset, ordering=()):
+        # fields the cursor pagination reads its position from
+        extra = [field.lstrip('-') for field in ordering or () if field.lstrip('-') not in cls.value_fields]
+        return queryset.values(*cls.value_fields, *extra).annotate(
+            category_ids=ArrayAgg('category__id', filter=Q(category__isnull=False), ordering='category__id'),
+        )
+
+    @property
+    def data(self):
+        return [
+            {
+                'id': row['id'],
+                'title': row['title'],
+                'description': row['description'],
+                'year': row['year'],
+                'imdb_rating': row['imdb_rating'],
+                'category': row['category_ids'],
+            }
+            for row in self.instance
+        ]
+
+
+class MovieBulkListSerializer(serializers.ListSerializer):
+    """
+    Validate a list of movies and write it with bulk queries. Every item is
+    validated before anything is written, the category ids of all items and,
+    for updates, the movies themselves are looked up with one query each.
+    """
+    max_items = 1000
+
+    def to_internal_value(self, data):
+        if isinstance(data, list) and len(data) > self.max_items:
+            raise serializers.ValidationError({
+                'non_field_errors': [f'Ensure this list has no more than {self.max_items} items.']
+            })
+        items = super().to_internal_value(data)
+        errors = [{} for _ in items]
+        category_ids = {pk for item in items for pk in item['category']}
+        known = set(Category.objects.filter(pk__in=category_ids).values_list('pk', flat=True))
+        for item, item_errors in zip(items, errors):
+            missing = [pk for pk in item['category'] if pk not in known]
+            if missing:
+                item_errors['category'] = [f'Invalid pk "{pk}" - object does not exist.' for pk in missing]
+        if self.instance is not None:
+            ids = [item.get('id') for item in items]
+            self.movies = self.instance.in_bulk([pk for pk in ids if pk is not None])
+            seen = set()
+            for pk, item_errors in zip(ids, errors):
+                if pk is None:
+                    item_errors['id'] = ['This field is required.']
+                elif pk not in self.movies:
+                    item_errors['id'] = [f'Invalid pk "{pk}" - object does not exist.']
+                elif pk in seen:
+                    item_errors['id'] = [f'Duplicate pk "{pk}".']
+                seen.add(pk)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return items
+
+    def create(self, validated_data):
+        categories = [item.pop('category') for item in validated_data]
+        movies = Movie.objects.bulk_create(
+            Movie(**{name: value for name, value in item.items() if name != 'id'}) for item in validated_data
+        )
+        self.set_categories(movies, categories, clear=False)
+        return movies
+
+    def update(self, instance, validated_data):
+        now = timezone.now()
+        fields = set()
+        movies = []
+        categories = []
+        for item in validated_data:
+            movie = self.movies[item.pop('id')]
+            categories.append(item.pop('category'))
+            for name, value in item.items():
+                setattr(movie, name, value)
+            # bulk_update leaves auto_now fields alone
+            movie.updated_at = now
+            fields.update(item, ['updated_at'])
+            movies.append(movie)
+        Movie.objects.bulk_update(movies, sorted(fields))
+        self.set_categories(movies, categories, clear=True)
+        return movies
+
+    def set_categories(self, movies, categories, clear):
+        """
+        Replace the categories of the movies and refresh their search documents,
+        bulk writes send no m2m_changed or post_save signals.
+        """
+        through = Movie.category.through
+        ids = [movie.pk for movie in movies]
+        if clear:
+            through.objects.filter(movie_id__in=ids).delete()
+        through.objects.bulk_create(
+            through(movie_id=movie.pk, category_id=category_id)
+            for movie, category_ids in zip(movies, categories)
+            for category_id in dict.fromkeys(category_ids)
+        )
+        Movie.objects.filter(pk__in=ids).update(search_vector=MOVIE_SEARCH_VECTOR)
+
+
+class MovieBulkSerializer(serializers.ModelSerializer):
+    """
+    Item of the bulk movie endpoint, a movie with the id to update and the
+    category ids, which are checked by MovieBulkListSerializer in one query.
+    """
+    id = serializers.IntegerField(required=False)
+    # required and not empty, like the category of MovieSerializer
+    category = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+    class Meta:
+        model = Movie
+        fields = MovieSerializer.Meta.fields
+        list_serializer_class = MovieBulkListSerializer
+
 
 class RentalSerializer(serializers.ModelSerializer):
+    price = serializers.SerializerMethodField()
+
     class Meta:
         model = Rental
         fields = ('id', 'rented_at', 'activated', 'price')
 
+    def get_price(self, rental):
+        # rentals read through Rental.objects.with_price() carry the amount due today, or paid
+        return getattr(rental, 'current_price', rental.price)
+
 class PaymentSerializer(serializers.ModelSerializer):
     rental = RentalSerializer(many=False, read_only=True)
     class Meta:
         model = Payment
         fields = ('id', 'rental', 'amount','created_at', 'updated_at')
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        # join the nested rental instead of querying it per payment
+        return queryset.select_related('rental')
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ('id', 'username', 'password')
\ No newline at end of file
+        fields = ('id', 'username', 'password')
+
+    # the passwords are stored hashed, hashing in the password pool
+    def create(self, validated_data):
+        validated_data['password'] = make_password(validated_data['password'])
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        if 'password' in validated_data:
+            validated_data['password'] = make_password(validated_data['password'])
+        return super().update(instance, validated_data)
+
+class TokenRefreshSerializer(JWTTokenRefreshSerializer):
+
+    def validate(self, attrs):
+        try:
+            refresh = RefreshToken(attrs['refresh'])
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+        if is_revoked(refresh):
+            raise InvalidToken('Token is revoked')
+        return super().validate(attrs)
+
+
+class TokenRevokeSerializer(serializers.Serializer):
+    refresh = serializers.CharField(required=False)
+
+    def validate_refresh(self, value):
+        try:
+            refresh = RefreshToken(value)
+        except TokenError as e:
+            raise serializers.ValidationError(e.args[0])
+        if refresh.get(api_settings.USER_ID_CLAIM) != self.context['request'].user.pk:
+            raise serializers.ValidationError('Token belongs to another user')
+        return refresh
@@ -0,0 +1,53 @@
+from django.core.signals import request_started
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from .authentication import user_cache
+from .cache import bump_catalog_version
+from .db import check_reused_connections
+from .models import Category, Movie
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(m2m_changed, sender=Movie.category.through)
+def invalidate_catalog(sender, **kwargs):
+    # after the commit, a read of the rows before it would be cached under the new version
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(m2m_changed, sender=Movie.category.through)
+def touch_movies(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    The categories are part of a movie, keep its updated_at (used for the
+    ETag and Last-Modified of catalog responses) in step with them.
+    """
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            Movie.objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+    elif action in ('post_add', 'post_remove'):
+        Movie.objects.filter(pk__in=pk_set).update(updated_at=timezone.now())
+    elif action == 'pre_clear':
+        instance.movies.update(updated_at=timezone.now())
+
+
+@receiver(pre_delete, sender=Category)
+def touch_category_movies(sender, instance, **kwargs):
+    # the cascade deletes the links of the category without m2m_changed
+    instance.movies.update(updated_at=timezone.now())
+
+
+@receiver(request_started)
+def check_connections(sender, **kwargs):
+    # Django has closed the obsolete connections, check the ones it reuses
+    check_reused_connections()
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_user(sender, instance, **kwargs):
+    user_cache.delete(instance.pk)
@@ -1,10 +1,39 @@
 import datetime
-from django.test import TestCase, testcases
+import json
+import multiprocessing
+import os
+import runpy
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
+import msgpack
+from asgiref.sync import SyncToAsync, async_to_sync, sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.signals import request_started
+from django.db import OperationalError, connection, connections, transaction
+from django.http import Http404, HttpResponse
+from django.test import AsyncClient, AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings, testcases
+from django.test.utils import CaptureQueriesContext
+from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth.models import User
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from rest_framework.settings import api_settings
 from rest_framework.test import APIRequestFactory, force_authenticate
-from .models import Movie, Category, Rental, Payment
-from . import views
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from rest_framework_simplejwt.tokens import RefreshToken
+from .models import Movie, Category, Rental, Payment, IdempotencyKey, RevokedToken, MOVIE_SEARCH_VECTOR
+from .serializers import MovieSerializer
+from .pricing import TierPricing, default_pricing, rental_days
+from .cache import get_catalog_version
+from .authentication import LRUCache, user_cache
+from . import hashing, throttling
+from .management.commands import settle_rentals
+from .revocation import BloomFilter, RevocationList, is_revoked, revocation_list
+from . import async_views, routers, views
 
 # Create your tests here.
 class MovieListTest(TestCase):
@@ -89,8 +118,9 @@ class MovieDetailTest(TestCase):
         movie2.category.set([fantasy_category])
 
     def test_movie_detail(self):
-        request = self.factory.get('/movies/1/')
-        response = views.MovieDetail.as_view()(request, pk=1)
+        movie = Movie.objects.get(title='Harry Potter')
+        request = self.factory.get(f'/movies/{movie.id}/')
+        response = views.MovieDetail.as_view()(request, pk=movie.id)
         self.assertEqual(response.status_code, 200)
     
     def tearDown(self):
@@ -384,6 +414,58 @@ class RentalListTest6(TestCase):
         User.objects.all().delete()
         Category.objects.all().delete()
 
+class RentTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(username='user1', password='user1')
+        self.movie = Movie.objects.create(title='Tomb Raider', description='A Lara Croft film', year=2018, imdb_rating=7.5)
+
+    def rent(self, pk):
+        request = self.factory.post(f'/movies/{pk}/rentals/', {})
+        force_authenticate(request, user=self.user)
+        return views.RentalListByMovie.as_view()(request, pk=pk)
+
+    def test_rent_twice(self):
+        self.assertEqual(self.rent(self.movie.id).status_code, 201)
+        self.assertEqual(self.rent(self.movie.id).status_code, 400)
+        self.assertEqual(Rental.objects.count(), 1)
+
+    def test_rent_again_after_payment(self):
+        Rental.objects.create(user=self.user, movie=self.movie, activated=True)
+        self.assertEqual(self.rent(self.movie.id).status_code, 201)
+        self.assertEqual(Rental.objects.filter(activated=False).count(), 1)
+
+    def test_rent_unknown_movie(self):
+        response = self.rent(self.movie.id + 1000)
+        self.assertEqual(response.status_code, 404)
+
+    def tearDown(self):
+        Rental.objects.all().delete()
+        Movie.objects.all().delete()
+        User.objects.all().delete()
+
+class ConcurrentRentTest(TransactionTestCase):
+    def test_concurrent_rent(self):
+        user = User.objects.create_user(username='user1', password='user1')
+        movie = Movie.objects.create(title='Tomb Raider', description='A Lara Croft film', year=2018, imdb_rating=7.5)
+        barrier = threading.Barrier(4)
+        results = []
+
+        def rent():
+            barrier.wait()
+            try:
+                results.append(Rental.objects.rent(user, movie.id))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=rent) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len([result for result in results if result is not None]), 1)
+        self.assertEqual(Rental.objects.count(), 1)
+
 class RentalDetailTest1(TestCase):
     def setUp(self):
         self.factory = APIRequestFactory()
@@ -522,6 +604,255 @@ class RentalDetailTest6(TestCase):
         User.objects.all().delete()
         Category.objects.all().delete()
 
+class RentalPriceTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_superuser(username='superuser', password='superuser')
+        movie = Movie.objects.create(title='Tomb Raider', description='A Lara Croft film', year=2018, imdb_rating=7.5)
+        for days in (0, 2, 3, 10):
+            user = User.objects.create_user(username=f'user{days}', password='user')
+            Rental.objects.create(user=user, movie=movie, rented_at=timezone.now() - datetime.timedelta(days=days))
+
+    def test_rental_price_tiers(self):
+        prices = sorted(rental.current_price for rental in Rental.objects.with_price())
+        self.assertEqual(prices, [1, 2, 3, 6.5])
+
+    def test_rental_price_read_without_writes(self):
+        movie = Movie.objects.get(title='Tomb Raider')
+        request = self.factory.get(f'/movies/{movie.id}/rentals/')
+        force_authenticate(request, user=self.user)
+        response = views.RentalListByMovie.as_view()(request, pk=movie.id)
+        self.assertEqual(sorted(rental['price'] for rental in response.data), [1, 2, 3, 6.5])
+        self.assertEqual(set(Rental.objects.values_list('price', flat=True)), {1.0})
+
+    def test_paid_rental_price(self):
+        # a paid rental keeps the amount paid, however long ago it was rented
+        rental = Rental.objects.get(user__username='user10')
+        Rental.objects.filter(pk=rental.pk).update(activated=True, price=4.0)
+        request = self.factory.get(f'/rentals/{rental.id}/')
+        force_authenticate(request, user=self.user)
+        response = views.RentalDetail.as_view()(request, pk=rental.id)
+        self.assertEqual(response.data['price'], 4.0)
+        prices = sorted(rental.current_price for rental in Rental.objects.with_price())
+        self.assertEqual(prices, [1, 2, 3, 4])
+
+    def tearDown(self):
+        Rental.objects.all().delete()
+        Movie.objects.all().delete()
+        User.objects.all().delete()
+
+class RentalDeleteTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='user1')
+        self.movie = Movie.objects.create(title='Tomb Raider', description='A Lara Croft film', year=2018, imdb_rating=7.5)
+        self.other_movie = Movie.objects.create(title='Hobbit', description='A hobbit film', year=2012, imdb_rating=7.8)
+        for movie in (self.movie, self.movie, self.other_movie):
+            rental = Rental.objects.create(user=self.user, movie=movie, activated=True)
+            Payment.objects.create(rental=rental, amount=1)
+
+    def test_delete_with_payments(self):
+        with self.assertNumQueries(2):
+            deleted = Rental.objects.filter(movie=self.movie).delete_with_payments()
+        self.assertEqual(deleted, 2)
+        self.assertEqual(list(Rental.objects.values_list('movie_id', flat=True)), [self.other_movie.id])
+        self.assertEqual(list(Payment.objects.values_list('rental__movie_id', flat=True)), [self.other_movie.id])
+
+class PricingTest(TestCase):
+    def test_quote_tiers(self):
+        pricing = TierPricing(((3, 1.0), (None, 0.5)))
+        self.assertEqual(list(pricing.quote([-1, 0, 1, 2, 3, 4, 10])), [1, 1, 1, 2, 3, 3.5, 6.5])
+
+    def test_quote_custom_tiers(self):
+        pricing = TierPricing(((1, 2.0), (2, 1.0), (None, 0.25)))
+        self.assertEqual(list(pricing.quote([1, 2, 3, 7])), [2, 3, 4, 5])
+
+    def test_quote_matches_database(self):
+        user = User.objects.create_user(username='user1', password='user1')
+        for days in range(12):
+            movie = Movie.objects.create(title=f'Movie {days}', description='A film', year=2018, imdb_rating=7.5)
+            Rental.objects.create(user=user, movie=movie, rented_at=timezone.now() - datetime.timedelta(days=days))
+        rentals = list(Rental.objects.with_price().order_by('id'))
+        days = rental_days([rental.rented_at for rental in rentals], timezone.now())
+        self.assertEqual(list(default_pricing().quote(days)), [rental.current_price for rental in rentals])
+
+class RentalQuoteTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(username='user1', password='user1')
+        user2 = User.objects.create_user(username='user2', password='user2')
+        movie = Movie.objects.create(title='Tomb Raider', description='A Lara Croft film', year=2018, imdb_rating=7.5)
+        movie2 = Movie.objects.create(title='Hobbit', description='A hobbit film', year=2012, imdb_rating=7.8)
+        self.rental1 = Rental.objects.create(user=self.user, movie=movie, rented_at=timezone.now() - datetime.timedelta(days=2))
+        self.rental2 = Rental.objects.create(user=self.user, movie=movie2, rented_at=timezone.now() - datetime.timedelta(days=5))
+        self.rental3 = Rental.objects.create(user=user2, movie=movie)
+
+    def test_rental_quote(self):
+        request = self.factory.get('/rentals/quote/')
+        force_authenticate(request, user=self.user)
+        response = views.RentalQuote.as_view()(request)
+        self.assertEqual(response.data, [
+            {'id': self.rental1.id, 'days': 2, 'price': 2.0},
+            {'id': self.rental2.id, 'days': 5, 'price': 4.0},
+        ])
+
+    def test_rental_quote_ids(self):
+        request = self.factory.get(f'/rentals/quote/?ids={self.rental2.id},{self.rental3.id}')
+        force_authenticate(request, user=self.user)
+        response = views.RentalQuote.as_view()(request)
+        self.assertEqual([quote['id'] for quote in response.data], [self.rental2.id])
+
+    def test_rental_quote_unauthorized(self):
+        request = self.factory.get('/rentals/quote/')
+        response = views.RentalQuote.as_view()(request)
+        self.assertEqual(response.status_code, 401)
+
+    def tearDown(self):
+        Rental.objects.all().delete()
+        Movie.objects.all().delete()
+        User.objects.all().delete()
+
+class SettleRentalsTest(TestCase):
+    def setUp(self):
+        movie = Movie.objects.create(title='Tomb Raider', description='A Lara Croft film', year=2018, imdb_rating=7.5)
+        for days in (0, 2, 3, 10, 5):
+            user = User.objects.create_user(username=f'user{days}', password='user')
+            Rental.objects.create(user=user, movie=movie, rented_at=timezone.now() - datetime.timedelta(days=days))
+        Rental.objects.create(user=user, movie=movie, rented_at=timezone.now() - datetime.timedelta(days=7), activated=True, price=5)
+
+    def test_settle_rentals(self):
+        call_command('settle_rentals', chunk_size=2, stdout=StringIO())
+        prices = list(Rental.objects.order_by('id').values_list('price', flat=True))
+        self.assertEqual(prices, [1, 2, 3, 6.5, 4, 5])
+
+    def test_settle_rentals_without_server_side_cursors(self):
+        # behind a transaction pooler the rentals are read by keyset, chunk by chunk
+        with mock.patch.dict(connection.settings_dict, {'DISABLE_SERVER_SIDE_CURSORS': True}), \
+                CaptureQueriesContext(connection) as queries:
+            call_command('settle_rentals', chunk_size=2, stdout=StringIO())
+        prices = list(Rental.objects.order_by('id').values_list('price', flat=True))
+        self.assertEqual(prices, [1, 2, 3, 6.5, 4, 5])
+        reads = [query['sql'] for query in queries if query['sql'].startswith('SELECT')]
+        self.assertEqual(len(reads), 3)
+        self.assertTrue(all('LIMIT 2' in sql for sql in reads))
+
+    def test_settle_rentals_resume(self):
+        first = Rental.objects.order_by('id').first()
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, 'settle_rentals')
+            with open(checkpoint, 'w') as f:
+                f.write(str(first.id + 2))
+            out = StringIO()
+            call_command('settle_rentals', checkpoint=checkpoint, stdout=out)
+            self.assertFalse(os.path.exists(checkpoint))
+        prices = list(Rental.objects.order_by('id').values_list('price', flat=True))
+        self.assertEqual(prices, [1, 1, 1, 6.5, 4, 5])
+        self.assertIn('Settled 2 rentals', out.getvalue())
+
+    def test_settle_rentals_paid_meanwhile(self):
+        chunk = list(Rental.objects.filter(activated=False).order_by('id'))
+        paid = chunk[3]
+        Rental.objects.filter(pk=paid.pk).update(activated=True, price=9)
+        updated_at = chunk[1].updated_at
+        updated = settle_rentals.Command().settle(chunk, default_pricing(), timezone.now(), None)
+        self.assertEqual(updated, 3)
+        self.assertEqual(list(Rental.objects.order_by('id').values_list('price', flat=True)), [1, 2, 3, 9, 4, 5])
+        self.assertGreater(Rental.objects.get(pk=chunk[1].pk).updated_at, updated_at)
+
+    def tearDown(self):
+        Rental.objects.all().delete()
+        Movie.objects.all().delete()
+        User.objects.all().delete()
+
+class ImportCatalogTest(TestCase):
+    basics = (
+        'tconst\ttitleType\tprimaryTitle\toriginalTitle\tisAdult\tstartYear\tendYear\truntimeMinutes\tgenres\n'
+        'tt0000001\tmovie\tTomb Raider\tTomb Raider\t0\t2018\t\\N\t119\tAction,Adventure\n'
+        'tt0000002\tmovie\tThe "Quoted" Movie\tThe "Quoted" Movie\t0\t\\N\t\\N\t90\tDrama\n'
+        'tt0000003\ttvSeries\tA Series\tA Series\t0\t2001\t2003\t30\tComedy\n'
+    )
+    ratings = 'tconst\taverageRating\tnumVotes\ntt0000001\t6.1\t1000\n'
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.basics_path = self.write('title.basics.tsv', self.basics)
+        self.ratings_path = self.write('title.ratings.tsv', self.ratings)
+        Category.objects.create(name='Adventure')
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_import_catalog(self):
+        call_command('import_catalog', self.basics_path, ratings=self.ratings_path, stdout=StringIO())
+        movies = {movie.imdb_id: movie for movie in Movie.objects.all()}
+        self.assertEqual(set(movies), {'tt0000001', 'tt0000002'})
+        self.assertEqual(movies['tt0000001'].year, 2018)
+        self.assertEqual(movies['tt0000001'].imdb_rating, 6.1)
+        self.assertEqual(movies['tt0000002'].title, 'The "Quoted" Movie')
+        self.assertEqual(movies['tt0000002'].year, 0)
+        self.assertEqual(sorted(c.name for c in movies['tt0000001'].category.all()), ['Action', 'Adventure'])
+        self.assertEqual(Category.objects.filter(name='Adventure').count(), 1)
+        self.assertEqual(Movie.objects.filter(search_vector='raider').count(), 1)
+
+    def test_import_catalog_again(self):
+        call_command('import_catalog', self.basics_path, stdout=StringIO())
+        self.write('title.ratings.tsv', 'tconst\taverageRating\tnumVotes\ntt0000001\t7.5\t2000\n')
+        out = StringIO()
+        call_command('import_catalog', self.basics_path, ratings=self.ratings_path, stdout=out)
+        self.assertIn('Imported 1 movies, 0 new categories, 0 new movie categories', out.getvalue())
+        self.assertEqual(Movie.objects.count(), 2)
+        self.assertEqual(Movie.objects.get(imdb_id='tt0000001').imdb_rating, 7.5)
+        self.assertEqual(Movie.category.through.objects.count(), 3)
+
+    def test_import_catalog_touches_movies_with_new_categories(self):
+        call_command('import_catalog', self.basics_path, stdout=StringIO())
+        Movie.objects.update(updated_at=timezone.now() - datetime.timedelta(days=1))
+        self.write('title.basics.tsv', self.basics.replace('Action,Adventure', 'Action,Adventure,Fantasy'))
+        call_command('import_catalog', self.basics_path, stdout=StringIO())
+        an_hour_ago = timezone.now() - datetime.timedelta(hours=1)
+        self.assertGreater(Movie.objects.get(imdb_id='tt0000001').updated_at, an_hour_ago)
+        self.assertLess(Movie.objects.get(imdb_id='tt0000002').updated_at, an_hour_ago)
+
+    def test_import_catalog_keeps_tables_of_the_same_name(self):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE import_basics (id integer)')
+        call_command('import_catalog', self.basics_path, stdout=StringIO())
+        self.assertIn('import_basics', connection.introspection.table_names())
+
+    def test_import_catalog_invalidates_cache(self):
+        version = get_catalog_version()
+        call_command('import_catalog', self.basics_path, stdout=StringIO())
+        self.assertNotEqual(get_catalog_version(), version)
+
+    def tearDown(self):
+        self.directory.cleanup()
+        Movie.objects.all().delete()
+        Category.objects.all().delete()
+
+class GunicornConfigTest(TestCase):
+    def load(self, **environ):
+        with mock.patch.dict(os.environ, environ):
+            return runpy.run_path(os.path.join(settings.BASE_DIR, 'gunicorn.conf.py'))
+
+    def test_gunicorn_wsgi(self):
+        config = self.load(SERVER_INTERFACE='wsgi', WEB_CONCURRENCY='3')
+        self.assertEqual(config['wsgi_app'], 'moviestore.wsgi:application')
+        self.assertEqual(config['worker_class'], 'gthread')
+        self.assertEqual(config['workers'], 3)
+        self.assertTrue(config['preload_app'])
+
+    def test_gunicorn_asgi(self):
+        config = self.load(SERVER_INTERFACE='asgi', SERVER_MAX_REQUESTS='500')
+        self.assertEqual(config['wsgi_app'], 'moviestore.asgi:application')
+        self.assertEqual(config['worker_class'], 'uvicorn.workers.UvicornWorker')
+        self.assertEqual((config['max_requests'], config['max_requests_jitter']), (500, 50))
+
+    def test_gunicorn_invalid_interface(self):
+        with self.assertRaises(ValueError):
+            self.load(SERVER_INTERFACE='cgi')
+
 class PaymentListTest1(TestCase):
     def setUp(self):
         self.factory = APIRequestFactory()
@@ -620,6 +951,69 @@ class PaymentListTest4(TestCase):
         User.objects.all().delete()
         Category.objects.all().delete()
 
+class ExportTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(username='user1', password='user1')
+        user2 = User.objects.create_user(username='user2', password='user2')
+        self.superuser = User.objects.create_superuser(username='superuser', password='superuser')
+        movie = Movie.objects.create(title='Tomb Raider', description='A Lara Croft film', year=2018, imdb_rating=7.5)
+        movie2 = Movie.objects.create(title='Lego Movie', description='', year=2014, imdb_rating=7.7)
+        Payment.objects.create(amount=1, rental=Rental.objects.create(user=self.user, movie=movie))
+        Payment.objects.create(amount=2, rental=Rental.objects.create(user=user2, movie=movie))
+        Payment.objects.create(amount=3, rental=Rental.objects.create(user=user2, movie=movie2))
+
+    def export(self, view, url, user, **extra):
+        request = self.factory.get(url, **extra)
+        force_authenticate(request, user=user)
+        response = view.as_view()(request)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_payment_export_ndjson(self):
+        response, content = self.export(views.PaymentExport, '/payments/export/', self.superuser)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        payments = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([payment['amount'] for payment in payments], [1, 2, 3])
+        self.assertEqual(payments[0]['user'], 'user1')
+
+    def test_payment_export_filters(self):
+        response, content = self.export(views.PaymentExport, '/payments/export/?user=user2&movie=lego', self.superuser)
+        self.assertEqual([json.loads(line)['amount'] for line in content.splitlines()], [3])
+
+    def test_payment_export_user(self):
+        response, content = self.export(views.PaymentExport, '/payments/export/?user=user2', self.user)
+        self.assertEqual([json.loads(line)['amount'] for line in content.splitlines()], [1])
+
+    def test_rental_export_csv(self):
+        response, content = self.export(views.RentalExport, '/rentals/export/', self.superuser, HTTP_ACCEPT='text/csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = content.splitlines()
+        self.assertEqual(lines[0], 'id,user,movie,rented_at,activated,price')
+        self.assertEqual(len(lines), 4)
+
+    def test_rental_export_csv_format_parameter(self):
+        response, content = self.export(views.RentalExport, '/rentals/export/?format=csv&movie=lego', self.superuser)
+        self.assertEqual(len(content.splitlines()), 2)
+
+    def test_export_without_server_side_cursors(self):
+        # behind a transaction pooler the rows are read by keyset, chunk by chunk
+        response, content = self.export(views.PaymentExport, '/payments/export/', self.superuser)
+        with mock.patch.dict(connection.settings_dict, {'DISABLE_SERVER_SIDE_CURSORS': True}), \
+                mock.patch.object(views.PaymentExport, 'chunk_size', 2), \
+                self.assertNumQueries(2):
+            response, keyset_content = self.export(views.PaymentExport, '/payments/export/', self.superuser)
+        self.assertEqual(keyset_content, content)
+
+    def test_export_unauthorized(self):
+        response = views.PaymentExport.as_view()(self.factory.get('/payments/export/'))
+        self.assertEqual(response.status_code, 401)
+
+    def tearDown(self):
+        Payment.objects.all().delete()
+        Rental.objects.all().delete()
+        Movie.objects.all().delete()
+        User.objects.all().delete()
+
 class PaymentListByMovieTest(TestCase):
     def setUp(self):
         self.factory = APIRequestFactory()
@@ -664,8 +1058,8 @@ class PaymentListByMovieTest2(TestCase):
         category2 = Category.objects.create(name='Action')
         movie2 = Movie.objects.create(title='Tomb Raider 2', description='A Lara Croft film', year=2018, imdb_rating=7.5)
         movie2.category.set([category2])
-        rental1 = Rental.objects.create(user=user, movie=movie)
-        rental2 = Rental.objects.create(user=user2, movie=movie)
+        rental1 = Rental.objects.create(user=user, movie=movie, activated=True)
+        rental2 = Rental.objects.create(user=user2, movie=movie, activated=True)
         Payment.objects.create(amount=4, rental = rental1)
         Payment.objects.create(amount=4, rental = rental2)
 
@@ -695,8 +1089,8 @@ class PaymentListByMovieTest3(TestCase):
         category2 = Category.objects.create(name='Action')
         movie2 = Movie.objects.create(title='Tomb Raider 2', description='A Lara Croft film', year=2018, imdb_rating=7.5)
         movie2.category.set([category2])
-        rental1 = Rental.objects.create(user=user, movie=movie)
-        rental2 = Rental.objects.create(user=user2, movie=movie)
+        rental1 = Rental.objects.create(user=user, movie=movie, activated=True)
+        rental2 = Rental.objects.create(user=user2, movie=movie, activated=True)
         Payment.objects.create(amount=4, rental = rental1)
         Payment.objects.create(amount=4, rental = rental2)
 
@@ -766,6 +1160,220 @@ class PaymentListByMovieTest5(TestCase):
         User.objects.all().delete()
         Category.objects.all().delete()
 
+class IdempotentPaymentTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(username='user1', password='user1')
+        self.movie = Movie.objects.create(title='Tomb Raider', description='A Lara Croft film', year=2018, imdb_rating=7.5)
+        Rental.objects.create(user=self.user, movie=self.movie)
+
+    def pay(self, amount, key=None):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        request = self.factory.post(f'/movies/{self.movie.id}/payments/', {'amount': amount}, format='json', **headers)
+        force_authenticate(request, user=self.user)
+        return views.PaymentListByMovie.as_view()(request, pk=self.movie.id)
+
+    def test_payment_retry_replayed(self):
+        self.assertEqual(self.pay(1, key='abc').status_code, 201)
+        response = self.pay(1, key='abc')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_payment_retry_without_key(self):
+        self.assertEqual(self.pay(1).status_code, 201)
+        self.assertEqual(self.pay(1).status_code, 400)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_payment_key_reused_for_other_request(self):
+        self.assertEqual(self.pay(2, key='abc').status_code, 400)
+        self.assertEqual(self.pay(1, key='abc').status_code, 422)
+        self.assertFalse(Payment.objects.exists())
+
+    def test_payment_expired_key(self):
+        self.pay(2, key='abc')
+        IdempotencyKey.objects.update(created_at=timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL + 1))
+        self.assertEqual(self.pay(1, key='abc').status_code, 201)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 201)
+
+    def test_clear_idempotency_keys(self):
+        self.pay(1, key='old')
+        IdempotencyKey.objects.update(created_at=timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL + 1))
+        self.pay(1, key='new')
+        out = StringIO()
+        call_command('clear_idempotency_keys', stdout=out)
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new'])
+        self.assertIn('Deleted 1', out.getvalue())
+
+    def tearDown(self):
+        IdempotencyKey.objects.all().delete()
+        Payment.objects.all().delete()
+        Rental.objects.all().delete()
+        Movie.objects.all().delete()
+        User.objects.all().delete()
+
+class ConcurrentPaymentTest(TransactionTestCase):
+    def test_concurrent_payment(self):
+        user = User.objects.create_user(username='user1', password='user1')
+        movie = Movie.objects.create(title='Tomb Raider', description='A Lara Croft film', year=2018, imdb_rating=7.5)
+        Rental.objects.create(user=user, movie=movie)
+        barrier = threading.Barrier(4)
+        statuses = []
+
+        def pay(key):
+            request = APIRequestFactory().post(f'/movies/{movie.id}/payments/', {'amount': 1}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+            force_authenticate(request, user=user)
+            barrier.wait()
+            try:
+                statuses.append(views.PaymentListByMovie.as_view()(request, pk=movie.id).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=pay, args=(key,)) for key in ('a', 'a', 'b', 'b')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(Payment.objects.count(), 1)
+        self.assertIn(201, statuses)
+        self.assertEqual(Rental.objects.get().activated, True)
+
+@override_settings(TOKEN_REVOCATION_REFRESH=3600)
+class CachedJWTAuthenticationTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(username='user1', password='user1')
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        user_cache.clear()
+        revocation_list.clear()
+        revocation_list.refresh()
+
+    def get(self, view, path, **kwargs):
+        request = self.factory.get(path, HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        return view.as_view()(request, **kwargs)
+
+    def test_user_cached(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get(views.RentalList, '/rentals/').status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get(views.RentalList, '/rentals/').status_code, 200)
+
+    def test_user_cache_expires(self):
+        self.get(views.RentalList, '/rentals/')
+        with mock.patch('time.monotonic', return_value=time.monotonic() + settings.AUTH_USER_CACHE_TTL + 1):
+            with self.assertNumQueries(2):
+                self.get(views.RentalList, '/rentals/')
+
+    def test_user_cache_invalidated_on_update(self):
+        self.get(views.RentalList, '/rentals/')
+        request = self.factory.put(f'/users/{self.user.id}/', {'username': 'renamed', 'password': 'user1'},
+                                   format='json', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        views.UserDetail.as_view()(request, pk=self.user.id)
+        response = self.get(views.UserList, '/users/')
+        self.assertEqual(response.data[0]['username'], 'renamed')
+
+    def test_user_cache_invalidated_on_delete(self):
+        self.get(views.RentalList, '/rentals/')
+        self.user.delete()
+        self.assertEqual(self.get(views.RentalList, '/rentals/').status_code, 401)
+
+    def test_lru_cache_size(self):
+        lru = LRUCache(maxsize=2, ttl=60)
+        lru.set(1, 'a')
+        lru.set(2, 'b')
+        lru.get(1)
+        lru.set(3, 'c')
+        self.assertEqual((lru.get(1), lru.get(2), lru.get(3)), ('a', None, 'c'))
+
+    def tearDown(self):
+        user_cache.clear()
+        revocation_list.clear()
+        User.objects.all().delete()
+
+class TokenRevocationTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(username='user1', password='user1')
+        self.refresh = RefreshToken.for_user(self.user)
+        self.access = self.refresh.access_token
+        revocation_list.clear()
+
+    def post(self, view, path, data, token=None):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        request = self.factory.post(path, data, format='json', **headers)
+        return view.as_view()(request)
+
+    def revoke(self, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.post(views.TokenRevoke, '/token/revoke/', data, token=self.access)
+
+    def test_revoke_unauthorized(self):
+        response = self.post(views.TokenRevoke, '/token/revoke/', {'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, 401)
+
+    def test_revoke(self):
+        response = self.revoke({'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(RevokedToken.objects.count(), 2)
+        request = self.factory.get('/rentals/', HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        self.assertEqual(views.RentalList.as_view()(request).status_code, 401)
+        response = self.post(views.TokenRefresh, '/token/refresh/', {'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, 401)
+
+    def test_refresh_not_revoked(self):
+        response = self.post(views.TokenRefresh, '/token/refresh/', {'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.data)
+
+    def test_revoke_refresh_of_another_user(self):
+        other = User.objects.create_user(username='user2', password='user2')
+        response = self.revoke({'refresh': str(RefreshToken.for_user(other))})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(RevokedToken.objects.exists())
+
+    def test_revoke_twice(self):
+        self.revoke({})
+        RevokedToken.objects.revoke([(self.access['jti'], timezone.now() + datetime.timedelta(minutes=5))])
+        self.assertEqual(RevokedToken.objects.count(), 1)
+
+    def test_check_without_query(self):
+        revocation_list.refresh()
+        with self.assertNumQueries(0):
+            self.assertFalse(is_revoked(self.access))
+
+    def test_other_process_refreshes(self):
+        other = RevocationList()
+        other.refresh()
+        self.revoke({})
+        self.assertFalse(other.is_revoked(self.access['jti']))
+        with mock.patch('time.monotonic', return_value=time.monotonic() + settings.TOKEN_REVOCATION_REFRESH):
+            with self.assertNumQueries(1):
+                self.assertTrue(other.is_revoked(self.access['jti']))
+
+    def test_reload_drops_expired(self):
+        RevokedToken.objects.revoke([('expired', timezone.now() - datetime.timedelta(minutes=5)),
+                                     ('active', timezone.now() + datetime.timedelta(minutes=5))])
+        revocation_list.refresh()
+        self.assertEqual(revocation_list.jtis, {'active'})
+
+    def test_clear_revoked_tokens(self):
+        RevokedToken.objects.revoke([('expired', timezone.now() - datetime.timedelta(minutes=5)),
+                                     ('active', timezone.now() + datetime.timedelta(minutes=5))])
+        call_command('clear_revoked_tokens', stdout=StringIO())
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['active'])
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000)
+        for i in range(1000):
+            bloom.add(f'revoked{i}')
+        self.assertTrue(all(f'revoked{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'valid{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def tearDown(self):
+        revocation_list.clear()
+        User.objects.all().delete()
+
 class UserListTest(TestCase):
 
     def setUp(self):
@@ -838,6 +1446,57 @@ class UserListTest4(TestCase):
     def tearDown(self): 
         User.objects.all().delete()
 
+class PasswordHashingTest(TestCase):
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+
+    def login(self, username, password):
+        request = self.factory.post('/token/', {'username': username, 'password': password}, format='json')
+        return TokenObtainPairView.as_view()(request)
+
+    def test_signup_hashes_password(self):
+        request = self.factory.post('/users/', {'username': 'user1', 'password': 'secret'}, format='json')
+        self.assertEqual(views.UserList.as_view()(request).status_code, 201)
+        user = User.objects.get(username='user1')
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+        self.assertTrue(user.check_password('secret'))
+        response = self.login('user1', 'secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.data)
+
+    def test_login_wrong_password(self):
+        User.objects.create_user(username='user1', password='secret')
+        self.assertEqual(self.login('user1', 'wrong').status_code, 401)
+        self.assertEqual(self.login('unknown', 'secret').status_code, 401)
+
+    def test_login_rehashes_outdated_password(self):
+        hasher = PBKDF2PasswordHasher()
+        user = User.objects.create(username='user1', password=hasher.encode('secret', hasher.salt(), iterations=1000))
+        self.assertEqual(self.login('user1', 'secret').status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith(f'pbkdf2_sha256${hasher.iterations}$'))
+
+    @override_settings(PASSWORD_HASH_PROCESSES=0)
+    def test_hash_in_request_thread(self):
+        User.objects.create_user(username='user1', password='secret')
+        with mock.patch.object(hashing, 'hash_executor') as hash_executor:
+            self.assertEqual(self.login('user1', 'secret').status_code, 200)
+        hash_executor.assert_not_called()
+
+    @override_settings(PASSWORD_HASH_TIMEOUT=0.01)
+    def test_pool_busy(self):
+        User.objects.create_user(username='user1', password='secret')
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+        with mock.patch.object(hashing, 'hash_executor', return_value=(None, slots)):
+            response = self.login('user1', 'secret')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+    def tearDown(self):
+        User.objects.all().delete()
+
 class UserDetailTest(TestCase):
 
     def setUp(self):
@@ -891,4 +1550,1181 @@ class UserDetailTest(TestCase):
         self.assertEqual(response.status_code, 200)
     
     def tearDown(self): 
-        User.objects.all().delete()
\ No newline at end of file
+        User.objects.all().delete()
+class MovieListPaginationTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        for i in range(5):
+            Movie.objects.create(title=f'Movie {i}', description='', year=2000 + i, imdb_rating=7.0)
+
+    def test_movie_list_cursor_pagination(self):
+        request = self.factory.get('/movies/?page_size=2')
+        response = views.MovieList.as_view()(request)
+        self.assertEqual(len(response.data), 2)
+        self.assertIn('rel="next"', response['Link'])
+        next_url = response['Link'].split(';')[0].strip('<>')
+        request = self.factory.get(next_url)
+        response2 = views.MovieList.as_view()(request)
+        self.assertEqual(len(response2.data), 2)
+        self.assertTrue(response.data[-1]['id'] < response2.data[0]['id'])
+        self.assertIn('rel="prev"', response2['Link'])
+
+    def tearDown(self):
+        Movie.objects.all().delete()
+
+class MovieListPaginationTest2(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        Movie.objects.create(title='Harry Potter', description='', year=2001, imdb_rating=7.5)
+
+    def test_movie_list_invalid_cursor(self):
+        request = self.factory.get('/movies/?cursor=invalid')
+        response = views.MovieList.as_view()(request)
+        self.assertEqual(response.status_code, 404)
+
+    def tearDown(self):
+        Movie.objects.all().delete()
+
+class MovieSearchTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        Movie.objects.create(title='The Godfather', description='The aging patriarch of an organized crime dynasty transfers control of his clandestine empire to his reluctant son.', year=1972, imdb_rating=9.2)
+        Movie.objects.create(title='Goodfellas', description='The story of Henry Hill and his life in the mafia, a crime family.', year=1990, imdb_rating=8.7)
+        Movie.objects.create(title='Lego Movie', description='An ordinary Lego construction worker is recruited to stop an evil tyrant.', year=2014, imdb_rating=7.7)
+
+    def test_movie_search(self):
+        request = self.factory.get('/movies/?q=crime family')
+        response = views.MovieList.as_view()(request)
+        self.assertEqual([movie['title'] for movie in response.data], ['Goodfellas'])
+
+    def test_movie_search_ranking(self):
+        request = self.factory.get('/movies/?q=godfather OR crime')
+        response = views.MovieList.as_view()(request)
+        self.assertEqual([movie['title'] for movie in response.data], ['The Godfather', 'Goodfellas'])
+
+    def test_movie_search_pagination(self):
+        request = self.factory.get('/movies/?q=godfather OR crime&page_size=1')
+        response = views.MovieList.as_view()(request)
+        next_url = response['Link'].split(';')[0].strip('<>')
+        response2 = views.MovieList.as_view()(self.factory.get(next_url))
+        self.assertEqual(response.data[0]['title'], 'The Godfather')
+        self.assertEqual(response2.data[0]['title'], 'Goodfellas')
+
+    def test_movie_search_pagination_tied_ranks(self):
+        # more stars rank higher, every rank twice
+        ids = {Movie.objects.create(title=f'Film {i}', description=' '.join(['star', 'film'] * (i % 6 + 1)), year=2000, imdb_rating=7).id
+               for i in range(12)}
+        url = '/movies/?q=star&page_size=1'
+        seen = []
+        while url:
+            response = views.MovieList.as_view()(self.factory.get(url))
+            seen.extend(movie['id'] for movie in response.data)
+            self.assertLessEqual(len(seen), 12)
+            links = [link for link in response.get('Link', '').split(', ') if link.endswith('rel="next"')]
+            url = links[0].split(';')[0].strip('<>') if links else None
+        self.assertEqual(sorted(seen), sorted(ids))
+
+    def test_movie_search_kept_in_sync(self):
+        movie = Movie.objects.get(title='Lego Movie')
+        movie.description = 'A crime family of bricks.'
+        movie.save()
+        request = self.factory.get('/movies/?q=bricks')
+        response = views.MovieList.as_view()(request)
+        self.assertEqual(len(response.data), 1)
+
+    def tearDown(self):
+        Movie.objects.all().delete()
+
+class CatalogCacheTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        cache.clear()
+        self.category = Category.objects.create(name='Adventure')
+        self.movie = Movie.objects.create(title='Tomb Raider', description='A Lara Croft film', year=2018, imdb_rating=7.5)
+        self.movie.category.set([self.category])
+
+    def test_catalog_cache_hit(self):
+        views.MovieList.as_view()(self.factory.get('/movies/?year=2018&title=tomb'))
+        with self.assertNumQueries(0):
+            response = views.MovieList.as_view()(self.factory.get('/movies/?title=tomb&year=2018'))
+        self.assertEqual(response.data[0]['title'], 'Tomb Raider')
+
+    def test_catalog_cache_invalidated_on_save(self):
+        views.MovieDetail.as_view()(self.factory.get(f'/movies/{self.movie.id}/'), pk=self.movie.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movie.title = 'Tomb Raider 2'
+            self.movie.save()
+        response = views.MovieDetail.as_view()(self.factory.get(f'/movies/{self.movie.id}/'), pk=self.movie.id)
+        self.assertEqual(response.data['title'], 'Tomb Raider 2')
+
+    def test_catalog_cache_invalidated_on_category_change(self):
+        views.MovieListByCategory.as_view()(self.factory.get(f'/categories/{self.category.id}/movies/'), pk=self.category.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movie.category.clear()
+        response = views.MovieListByCategory.as_view()(self.factory.get(f'/categories/{self.category.id}/movies/'), pk=self.category.id)
+        self.assertEqual(len(response.data), 0)
+
+    def test_catalog_cache_invalidated_on_delete(self):
+        views.CategoryList.as_view()(self.factory.get('/categories/'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.delete()
+        response = views.CategoryList.as_view()(self.factory.get('/categories/'))
+        self.assertEqual(len(response.data), 0)
+
+    def tearDown(self):
+        Movie.objects.all().delete()
+        Category.objects.all().delete()
+
+class CatalogCacheCommitTest(TransactionTestCase):
+    """
+    A read from another connection while a write is not committed yet sees
+    the rows of before it.
+    """
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        cache.clear()
+        self.category = Category.objects.create(name='Adventure')
+        self.movie = Movie.objects.create(title='Tomb Raider', description='A Lara Croft film', year=2018, imdb_rating=7.5)
+
+    def get_movie(self):
+        return views.MovieDetail.as_view()(self.factory.get(f'/movies/{self.movie.id}/'), pk=self.movie.id).data
+
+    def read_in_thread(self):
+        results = []
+
+        def read():
+            try:
+                results.append(self.get_movie())
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+        return results[0]
+
+    def test_catalog_cache_not_filled_before_commit(self):
+        with transaction.atomic():
+            self.movie.title = 'Tomb Raider 2'
+            self.movie.save()
+            self.movie.category.set([self.category])
+            self.assertEqual(self.read_in_thread()['title'], 'Tomb Raider')
+        data = self.get_movie()
+        self.assertEqual((data['title'], data['category']), ('Tomb Raider 2', [self.category.id]))
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        cache.clear()
+        self.category = Category.objects.create(name='Adventure')
+        self.movie = Movie.objects.create(title='Tomb Raider', description='A Lara Croft film', year=2018, imdb_rating=7.5)
+        self.movie.category.set([self.category])
+
+    def test_movie_list_etag(self):
+        response = views.MovieList.as_view()(self.factory.get('/movies/'))
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        request = self.factory.get('/movies/', HTTP_IF_NONE_MATCH=response['ETag'])
+        response2 = views.MovieList.as_view()(request)
+        self.assertEqual(response2.status_code, 304)
+        self.assertEqual(response2['ETag'], response['ETag'])
+
+    def test_movie_list_etag_without_cache(self):
+        response = views.MovieList.as_view()(self.factory.get('/movies/'))
+        cache.clear()
+        request = self.factory.get('/movies/', HTTP_IF_NONE_MATCH=response['ETag'])
+        with self.assertNumQueries(1):
+            response2 = views.MovieList.as_view()(request)
+        self.assertEqual(response2.status_code, 304)
+
+    def test_movie_detail_if_modified_since(self):
+        url = f'/movies/{self.movie.id}/'
+        response = views.MovieDetail.as_view()(self.factory.get(url), pk=self.movie.id)
+        request = self.factory.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        response2 = views.MovieDetail.as_view()(request, pk=self.movie.id)
+        self.assertEqual(response2.status_code, 304)
+
+    def test_movie_etag_changes_with_categories(self):
+        url = f'/movies/{self.movie.id}/'
+        response = views.MovieDetail.as_view()(self.factory.get(url), pk=self.movie.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movie.category.add(Category.objects.create(name='Action'))
+        request = self.factory.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        response2 = views.MovieDetail.as_view()(request, pk=self.movie.id)
+        self.assertEqual(response2.status_code, 200)
+        self.assertEqual(len(response2.data['category']), 2)
+
+    def test_movie_etag_changes_with_deleted_category(self):
+        url = f'/movies/{self.movie.id}/'
+        response = views.MovieDetail.as_view()(self.factory.get(url), pk=self.movie.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.delete()
+        request = self.factory.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        response2 = views.MovieDetail.as_view()(request, pk=self.movie.id)
+        self.assertEqual(response2.status_code, 200)
+        self.assertEqual(response2.data['category'], [])
+
+    def test_category_list_etag_changes(self):
+        response = views.CategoryList.as_view()(self.factory.get('/categories/'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = 'Action'
+            self.category.save()
+        request = self.factory.get('/categories/', HTTP_IF_NONE_MATCH=response['ETag'])
+        response2 = views.CategoryList.as_view()(request)
+        self.assertEqual(response2.status_code, 200)
+
+    def tearDown(self):
+        Movie.objects.all().delete()
+        Category.objects.all().delete()
+
+class RenderersTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        cache.clear()
+        self.category = Category.objects.create(name='Adventure')
+        movie = Movie.objects.create(title='Tomb Raider', description='A Lara Croft film', year=2018, imdb_rating=7.5)
+        movie.category.set([self.category])
+        self.user = User.objects.create_superuser(username='admin', password='admin')
+
+    def test_movie_list_json(self):
+        response = views.MovieList.as_view()(self.factory.get('/movies/'))
+        response.render()
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response.content)[0]['title'], 'Tomb Raider')
+
+    def test_movie_list_msgpack(self):
+        request = self.factory.get('/movies/', HTTP_ACCEPT='application/msgpack')
+        response = views.MovieList.as_view()(request)
+        response.render()
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        movies = msgpack.unpackb(response.content)
+        self.assertEqual(movies[0]['title'], 'Tomb Raider')
+        self.assertEqual(movies[0]['category'], [self.category.id])
+
+    def test_movie_creation_msgpack(self):
+        data = {'title': 'Tomb Raider 2', 'description': 'A Lara Croft film', 'year': 2018, 'imdb_rating': 7.5, 'category': [self.category.id]}
+        request = self.factory.post('/movies/', msgpack.packb(data), content_type='application/msgpack', HTTP_ACCEPT='application/msgpack')
+        force_authenticate(request, user=self.user)
+        response = views.MovieList.as_view()(request)
+        response.render()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(msgpack.unpackb(response.content)['title'], 'Tomb Raider 2')
+
+    def test_invalid_json(self):
+        request = self.factory.post('/categories/', b'{"name":', content_type='application/json')
+        force_authenticate(request, user=self.user)
+        response = views.CategoryList.as_view()(request)
+        self.assertEqual(response.status_code, 400)
+
+    def tearDown(self):
+        Movie.objects.all().delete()
+        Category.objects.all().delete()
+        User.objects.all().delete()
+
+class MovieBulkTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_superuser(username='superuser', password='superuser')
+        self.category1 = Category.objects.create(name='Adventure')
+        self.category2 = Category.objects.create(name='Fantasy')
+        self.movie = Movie.objects.create(title='Tomb Raider', description='A Lara Croft film', year=2018, imdb_rating=7.5)
+        self.movie.category.set([self.category1])
+
+    def bulk(self, method, data, user=None):
+        request = getattr(self.factory, method)('/movies/bulk/', data, format='json')
+        force_authenticate(request, user=user or self.user)
+        return views.MovieBulk.as_view()(request)
+
+    def test_movie_bulk_create(self):
+        data = [
+            {'title': 'Hobbit', 'description': 'A hobbit film', 'year': 2012, 'imdb_rating': 7.8,
+             'category': [self.category1.id, self.category2.id]},
+            {'title': 'Dune', 'description': 'A desert film', 'year': 2021, 'imdb_rating': 8.0,
+             'category': [self.category2.id]},
+        ]
+        response = self.bulk('post', data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([item['status'] for item in response.data], [201, 201])
+        hobbit = Movie.objects.get(pk=response.data[0]['id'])
+        self.assertEqual(set(hobbit.category.all()), {self.category1, self.category2})
+        self.assertEqual(Movie.objects.filter(search_vector='hobbit').count(), 1)
+
+    def test_movie_bulk_create_invalid(self):
+        data = [
+            {'title': 'Hobbit', 'description': 'A hobbit film', 'year': 2012, 'imdb_rating': 7.8,
+             'category': [self.category1.id]},
+            {'title': 'Dune', 'description': 'A desert film', 'year': 'soon', 'imdb_rating': 8.0,
+             'category': [self.category2.id]},
+        ]
+        response = self.bulk('post', data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('year', response.data[1])
+        self.assertEqual(Movie.objects.count(), 1)
+
+    def test_movie_bulk_create_unknown_category(self):
+        data = [
+            {'title': 'Hobbit', 'description': 'A hobbit film', 'year': 2012, 'imdb_rating': 7.8,
+             'category': [self.category1.id]},
+            {'title': 'Alien', 'description': 'A space film', 'year': 1979, 'imdb_rating': 8.5, 'category': [0]},
+        ]
+        response = self.bulk('post', data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('category', response.data[1])
+        self.assertEqual(Movie.objects.count(), 1)
+
+    def test_movie_bulk_create_without_category(self):
+        # the categories are required like when creating one movie
+        data = [
+            {'title': 'Hobbit', 'description': 'A hobbit film', 'year': 2012, 'imdb_rating': 7.8},
+            {'title': 'Dune', 'description': 'A desert film', 'year': 2021, 'imdb_rating': 8.0, 'category': []},
+        ]
+        response = self.bulk('post', data)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('category', response.data[0])
+        self.assertIn('category', response.data[1])
+        self.assertEqual(Movie.objects.count(), 1)
+
+    def test_movie_bulk_update(self):
+        data = [{'id': self.movie.id, 'title': 'Tomb Raider 2', 'description': 'A Lara Croft film',
+                 'year': 2019, 'imdb_rating': 7.0, 'category': [self.category2.id]}]
+        response = self.bulk('put', data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [{'id': self.movie.id, 'status': 200}])
+        movie = Movie.objects.get(pk=self.movie.id)
+        self.assertEqual((movie.title, movie.year), ('Tomb Raider 2', 2019))
+        self.assertGreater(movie.updated_at, self.movie.updated_at)
+        self.assertEqual(list(movie.category.all()), [self.category2])
+
+    def test_movie_bulk_update_unknown(self):
+        data = [{'id': self.movie.id + 1000, 'title': 'Unknown', 'description': 'Unknown', 'year': 2019, 'imdb_rating': 7.0,
+                 'category': [self.category1.id]}]
+        response = self.bulk('put', data)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('id', response.data[0])
+
+    def test_movie_bulk_delete(self):
+        response = self.bulk('delete', [self.movie.id, self.movie.id + 1000])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['status'] for item in response.data], [204, 404])
+        self.assertFalse(Movie.objects.exists())
+
+    def test_movie_bulk_delete_rentals(self):
+        user = User.objects.create_user(username='user1', password='user1')
+        rental = Rental.objects.create(user=user, movie=self.movie, activated=True)
+        Payment.objects.create(rental=rental, amount=1)
+        version = get_catalog_version()
+        # one catalog bump for the request, no signal per movie
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.bulk('delete', [self.movie.id])
+        self.assertEqual(callbacks, [])
+        self.assertEqual(get_catalog_version(), version + 1)
+        self.assertEqual(response.data, [{'id': self.movie.id, 'status': 204}])
+        self.assertFalse(Movie.objects.exists())
+        self.assertFalse(Rental.objects.exists())
+        self.assertFalse(Payment.objects.exists())
+        self.assertFalse(Movie.category.through.objects.exists())
+
+    def test_movie_bulk_delete_too_many(self):
+        response = self.bulk('delete', [self.movie.id] * 1001)
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(Movie.objects.exists())
+
+    def test_movie_bulk_delete_bool_ids(self):
+        # true and false are not the ids 1 and 0
+        response = self.bulk('delete', [True, False])
+        self.assertEqual(response.status_code, 400)
+        response = self.bulk('delete', [self.movie.id, True])
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(Movie.objects.exists())
+
+    def test_movie_bulk_invalidates_cache(self):
+        version = get_catalog_version()
+        self.bulk('post', [{'title': 'Dune', 'description': 'A desert film', 'year': 2021, 'imdb_rating': 8.0,
+                            'category': [self.category1.id]}])
+        self.assertNotEqual(get_catalog_version(), version)
+
+    def test_movie_bulk_unauthorized(self):
+        user = User.objects.create_user(username='user1', password='user1')
+        response = self.bulk('delete', [self.movie.id], user=user)
+        self.assertEqual(response.status_code, 401)
+        self.assertTrue(Movie.objects.exists())
+
+    def tearDown(self):
+        Movie.objects.all().delete()
+        Category.objects.all().delete()
+        User.objects.all().delete()
+
+class AsyncCatalogTest(TransactionTestCase):
+    """
+    The async views query from the database thread pool, outside of the test
+    transaction, so the data has to be committed.
+    """
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+        self.category = Category.objects.create(name='Adventure')
+        self.movie = Movie.objects.create(title='Tomb Raider', description='A Lara Croft film', year=2018, imdb_rating=7.5)
+        self.movie.category.set([self.category])
+        Movie.objects.create(title='Hobbit', description='A hobbit film', year=2012, imdb_rating=7.8)
+        self.sync_factory = APIRequestFactory()
+        cache.clear()
+        # the pool threads must not keep connections to the test database open
+        self.conn_max_age = connection.settings_dict['CONN_MAX_AGE']
+        connection.settings_dict['CONN_MAX_AGE'] = 0
+
+    def tearDown(self):
+        connection.settings_dict['CONN_MAX_AGE'] = self.conn_max_age
+
+    async def test_async_movie_list(self):
+        response = await async_views.movie_list(self.factory.get('/async/movies/?title=tomb'))
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual([movie['title'] for movie in data], ['Tomb Raider'])
+        self.assertEqual(data[0]['category'], [self.category.id])
+        self.assertIn('ETag', response)
+
+    async def test_async_movie_list_paginated(self):
+        response = await async_views.movie_list(self.factory.get('/async/movies/?page_size=1'))
+        self.assertEqual(len(json.loads(response.content)), 1)
+        self.assertIn('rel="next"', response['Link'])
+        self.assertIn('/async/movies/', response['Link'])
+
+    async def test_async_movie_list_invalid_cursor(self):
+        response = await async_views.movie_list(self.factory.get('/async/movies/?cursor=invalid'))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.content), {'detail': 'Invalid cursor'})
+        request = self.factory.get(f'/async/categories/{self.category.id}/movies/?cursor=invalid')
+        response = await async_views.movie_list_by_category(request, pk=self.category.id)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_async_title_search_throttled(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = throttling.BucketStore(os.path.join(directory, 'throttle'), 64)
+            with mock.patch.object(throttling, '_store', store), \
+                    mock.patch.dict(api_settings.DEFAULT_THROTTLE_RATES, {'title_search': '1/min'}):
+                response = await async_views.movie_list(self.factory.get('/async/movies/?title=tomb'))
+                self.assertEqual(response.status_code, 200)
+                response = await async_views.movie_list(self.factory.get('/async/movies/?title=hobbit'))
+                self.assertEqual(response.status_code, 429)
+                self.assertEqual(response['Retry-After'], '60')
+                response = await async_views.movie_list(self.factory.get('/async/movies/'))
+                self.assertEqual(response.status_code, 200)
+            store.close()
+
+    async def test_async_title_search_throttled_per_user(self):
+        # an authenticated user has the bucket of MovieList, not the one of their IP
+        user = await sync_to_async(User.objects.create_user)(username='user1', password='user1')
+        token = str(RefreshToken.for_user(user).access_token)
+        with tempfile.TemporaryDirectory() as directory:
+            store = throttling.BucketStore(os.path.join(directory, 'throttle'), 64)
+            with mock.patch.object(throttling, '_store', store), \
+                    mock.patch.dict(api_settings.DEFAULT_THROTTLE_RATES, {'title_search': '1/min'}):
+                request = self.factory.get('/async/movies/?title=tomb', **{'Authorization': f'Bearer {token}'})
+                response = await async_views.movie_list(request)
+                self.assertEqual(response.status_code, 200)
+                request = self.factory.get('/async/movies/?title=hobbit', **{'Authorization': f'Bearer {token}'})
+                response = await async_views.movie_list(request)
+                self.assertEqual(response.status_code, 429)
+                response = await async_views.movie_list(self.factory.get('/async/movies/?title=hobbit'))
+                self.assertEqual(response.status_code, 200)
+            store.close()
+
+    async def test_async_views_hold_no_thread(self):
+        # under ASGI the middleware awaits the async views instead of running them in a thread
+        running = []
+        blocked = []
+        sync_call = SyncToAsync.__call__
+        run_in_db_thread = async_views.run_in_db_thread
+
+        async def counted_sync_call(self, *args, **kwargs):
+            running.append(self)
+            try:
+                return await sync_call(self, *args, **kwargs)
+            finally:
+                running.remove(self)
+
+        async def counted_run_in_db_thread(function, *args):
+            blocked.append(len(running))
+            return await run_in_db_thread(function, *args)
+
+        with mock.patch.object(SyncToAsync, '__call__', counted_sync_call), \
+                mock.patch.object(async_views, 'run_in_db_thread', counted_run_in_db_thread):
+            response = await AsyncClient().get('/async/categories/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(blocked)
+        self.assertEqual(set(blocked), {0})
+
+    async def test_async_movie_detail_same_as_sync(self):
+        response = await async_views.movie_detail(self.factory.get(f'/async/movies/{self.movie.id}/'), pk=self.movie.id)
+        sync_response = await sync_to_async(views.MovieDetail.as_view())(self.sync_factory.get(f'/movies/{self.movie.id}/'), pk=self.movie.id)
+        self.assertEqual(json.loads(response.content), dict(sync_response.data))
+
+    async def test_async_movie_detail_not_found(self):
+        response = await async_views.movie_detail(self.factory.get('/async/movies/0/'), pk=0)
+        sync_response = await sync_to_async(views.MovieDetail.as_view())(self.sync_factory.get('/movies/0/'), pk=0)
+        sync_response.render()
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.content), json.loads(sync_response.content))
+
+    @override_settings(CATALOG_CACHE_TIMEOUT=0)
+    async def test_async_validators_match_body(self):
+        # the validators and the body are read in one snapshot, a write committed
+        # while the response is read is in both or in neither
+        read_validators = async_views.validators
+
+        def write():
+            try:
+                Movie.objects.filter(pk=self.movie.id).update(title='Tomb Raider 2', updated_at=timezone.now())
+            finally:
+                connection.close()
+
+        def write_then_validators(*args):
+            thread = threading.Thread(target=write)
+            thread.start()
+            thread.join()
+            return read_validators(*args)
+
+        with mock.patch.object(async_views, 'validators', write_then_validators):
+            response = await async_views.movie_detail(self.factory.get(f'/async/movies/{self.movie.id}/'), pk=self.movie.id)
+        self.assertEqual(json.loads(response.content)['title'], 'Tomb Raider 2')
+        request = self.factory.get(f'/async/movies/{self.movie.id}/', **{'If-None-Match': response['ETag']})
+        response = await async_views.movie_detail(request, pk=self.movie.id)
+        self.assertEqual(response.status_code, 304)
+
+    async def test_async_category_list(self):
+        response = await async_views.category_list(self.factory.get('/async/categories/'))
+        self.assertEqual(json.loads(response.content), [{'id': self.category.id, 'name': 'Adventure'}])
+
+    async def test_async_movie_list_by_category(self):
+        request = self.factory.get(f'/async/categories/{self.category.id}/movies/')
+        response = await async_views.movie_list_by_category(request, pk=self.category.id)
+        self.assertEqual([movie['id'] for movie in json.loads(response.content)], [self.movie.id])
+
+    async def test_async_not_modified(self):
+        response = await async_views.category_list(self.factory.get('/async/categories/'))
+        request = self.factory.get('/async/categories/', **{'If-None-Match': response['ETag']})
+        response = await async_views.category_list(request)
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(CATALOG_CACHE_TIMEOUT=0)
+    async def test_async_not_modified_uncached(self):
+        response = await async_views.movie_list(self.factory.get('/async/movies/'))
+        request = self.factory.get('/async/movies/', **{'If-None-Match': response['ETag']})
+        response = await async_views.movie_list(request)
+        self.assertEqual(response.status_code, 304)
+
+class ConnectionHealthTest(TransactionTestCase):
+    def kill_connection(self):
+        connection.ensure_connection()
+        pid = connection.connection.get_backend_pid()
+        other = connection.copy()
+        with other.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+        other.close()
+
+    def test_dead_connection_replaced(self):
+        self.kill_connection()
+        request_started.send(sender=self.__class__)
+        self.assertEqual(Category.objects.count(), 0)
+
+    def test_dead_connection_replaced_in_transaction(self):
+        self.kill_connection()
+        request_started.send(sender=self.__class__)
+        with transaction.atomic():
+            self.assertEqual(Category.objects.count(), 0)
+
+    def test_reused_connection_checked_once(self):
+        connection.ensure_connection()
+        with mock.patch.object(connection, 'is_usable', return_value=True) as is_usable:
+            request_started.send(sender=self.__class__)
+            # checked lazily, before the first query of the request
+            is_usable.assert_not_called()
+            Category.objects.count()
+            Category.objects.count()
+            self.assertEqual(is_usable.call_count, 1)
+
+    def test_new_connection_not_checked(self):
+        connection.close()
+        with mock.patch.object(connection, 'is_usable', return_value=True) as is_usable:
+            request_started.send(sender=self.__class__)
+            Category.objects.count()
+            is_usable.assert_not_called()
+
+    @override_settings(DB_HEALTH_CHECKS=False)
+    def test_dead_connection_without_health_checks(self):
+        self.kill_connection()
+        with self.assertRaises(OperationalError):
+            Category.objects.count()
+        connection.close()
+
+    def test_benchmark_connections(self):
+        out = StringIO()
+        call_command('benchmark_connections', requests=3, stdout=out)
+        self.assertIn('persistent + health check', out.getvalue())
+
+@override_settings(DB_REPLICAS=['replica'])
+class ReplicaRouterTest(TransactionTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # a second alias of the test database stands in for a replica
+        connections.settings['replica'] = {
+            **connection.settings_dict,
+            'TEST': {**connection.settings_dict['TEST'], 'MIRROR': 'default'},
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        super().tearDownClass()
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(username='user1', password='user1')
+        movie = Movie.objects.create(title='Tomb Raider', description='A Lara Croft film', year=2018, imdb_rating=7.5)
+        Rental.objects.create(user=self.user, movie=movie)
+        routers._lags.clear()
+        cache.clear()
+
+    def get(self, view, path, user=None):
+        request = self.factory.get(path)
+        if user is not None:
+            force_authenticate(request, user=user)
+        with CaptureQueriesContext(connection) as primary, CaptureQueriesContext(connections['replica']) as replica:
+            response = view.as_view()(request)
+            self.assertEqual(response.status_code, 200)
+        return len(primary), len(replica)
+
+    @override_settings(CATALOG_CACHE_TIMEOUT=0)
+    def test_replica_reads(self):
+        primary, replica = self.get(views.MovieList, '/movies/')
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+        primary, replica = self.get(views.RentalList, '/rentals/', user=self.user)
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_catalog_cache_filled_from_primary(self):
+        # a replica behind the last write must not cache the rows of before it
+        primary, replica = self.get(views.MovieList, '/movies/')
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+        primary, replica = self.get(views.MovieList, '/movies/')
+        self.assertEqual((primary, replica), (0, 0))
+
+    def test_primary_reads(self):
+        movie = Movie.objects.get()
+        request = self.factory.get(f'/movies/{movie.id}/')
+        with CaptureQueriesContext(connections['replica']) as replica:
+            views.MovieDetail.as_view()(request, pk=movie.id)
+        self.assertEqual(len(replica), 0)
+
+    @override_settings(CATALOG_CACHE_TIMEOUT=0)
+    def test_lagging_replica(self):
+        routers._lags['replica'] = (time.monotonic(), 60.0)
+        primary, replica = self.get(views.MovieList, '/movies/')
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_pinned_after_write(self):
+        request = RequestFactory().post(f'/movies/1/rentals/')
+        request.user = self.user
+        routers.primary_pin_middleware(lambda request: HttpResponse(status=201))(request)
+        self.assertTrue(routers.is_pinned(self.user))
+        primary, replica = self.get(views.RentalList, '/rentals/', user=self.user)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_pinned_after_async_write(self):
+        async def get_response(request):
+            return HttpResponse(status=201)
+        request = RequestFactory().post(f'/movies/1/rentals/')
+        request.user = self.user
+        async_to_sync(routers.primary_pin_middleware(get_response))(request)
+        self.assertTrue(routers.is_pinned(self.user))
+
+    def test_not_pinned_after_failed_write(self):
+        request = RequestFactory().post(f'/movies/1/rentals/')
+        request.user = self.user
+        routers.primary_pin_middleware(lambda request: HttpResponse(status=400))(request)
+        self.assertFalse(routers.is_pinned(self.user))
+
+    def test_transaction_reads_primary(self):
+        with transaction.atomic():
+            primary, replica = self.get(views.MovieList, '/movies/')
+        self.assertEqual(replica, 0)
+
+class MovieAutocompleteTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        Movie.objects.create(title='The Godfather', description='', year=1972, imdb_rating=9.2)
+        Movie.objects.create(title='The Godfather: Part II', description='', year=1974, imdb_rating=9.0)
+        Movie.objects.create(title='Lego Movie', description='', year=2014, imdb_rating=7.7)
+
+    def test_movie_autocomplete(self):
+        request = self.factory.get('/movies/autocomplete/?q=godfat')
+        response = views.MovieAutocomplete.as_view()(request)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(set(response.data[0]), {'id', 'title'})
+
+    def test_movie_autocomplete_limit(self):
+        request = self.factory.get('/movies/autocomplete/?q=godfather&limit=1')
+        response = views.MovieAutocomplete.as_view()(request)
+        self.assertEqual([movie['title'] for movie in response.data], ['The Godfather'])
+
+    def test_movie_autocomplete_empty(self):
+        request = self.factory.get('/movies/autocomplete/')
+        response = views.MovieAutocomplete.as_view()(request)
+        self.assertEqual(response.data, [])
+
+    def tearDown(self):
+        Movie.objects.all().delete()
+
+class MovieListQueriesTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        category1 = Category.objects.create(name='Adventure')
+        category2 = Category.objects.create(name='Fantasy')
+        for i in range(20):
+            movie = Movie.objects.create(title=f'Movie {i}', description='', year=2000, imdb_rating=7.0)
+            movie.category.set([category1, category2])
+
+    def test_movie_list_queries(self):
+        request = self.factory.get('/movies/')
+        with self.assertNumQueries(2):
+            response = views.MovieList.as_view()(request)
+            self.assertEqual(len(response.data), 20)
+
+    def test_movie_list_by_category_queries(self):
+        category = Category.objects.get(name='Fantasy')
+        request = self.factory.get(f'/categories/{category.id}/movies/')
+        with self.assertNumQueries(3):
+            response = views.MovieListByCategory.as_view()(request, pk=category.id)
+            self.assertEqual(len(response.data), 20)
+
+    def test_movie_list_same_as_serializer(self):
+        Movie.objects.create(title='No category', description='', year=2000, imdb_rating=7.0)
+        response = views.MovieList.as_view()(self.factory.get('/movies/?page_size=100'))
+        movies = MovieSerializer.setup_eager_loading(Movie.objects.order_by('id'))
+        expected = MovieSerializer(movies, many=True).data
+        for movie in expected:
+            movie['category'] = sorted(movie['category'])
+        self.assertEqual(response.data, expected)
+
+    def test_movie_list_filtered_by_category_keeps_all_categories(self):
+        request = self.factory.get('/movies/?category=Adventure')
+        response = views.MovieList.as_view()(request)
+        self.assertEqual(len(response.data), 20)
+        self.assertEqual(len(response.data[0]['category']), 2)
+
+    def tearDown(self):
+        Movie.objects.all().delete()
+        Category.objects.all().delete()
+
+class PaymentListQueriesTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_superuser(username='superuser', password='superuser')
+        movie = Movie.objects.create(title='Tomb Raider', description='A Lara Croft film', year=2018, imdb_rating=7.5)
+        for i in range(20):
+            rental = Rental.objects.create(user=self.user, movie=movie, activated=True)
+            Payment.objects.create(amount=1, rental=rental)
+
+    def test_payment_list_queries(self):
+        request = self.factory.get('/payments/')
+        force_authenticate(request, user=self.user)
+        with self.assertNumQueries(1):
+            response = views.PaymentList.as_view()(request)
+            self.assertEqual(len(response.data), 20)
+
+    def test_payment_list_by_movie_queries(self):
+        movie = Movie.objects.get(title='Tomb Raider')
+        request = self.factory.get(f'/movies/{movie.id}/payments/')
+        force_authenticate(request, user=self.user)
+        with self.assertNumQueries(2):
+            response = views.PaymentListByMovie.as_view()(request, pk=movie.id)
+            self.assertEqual(len(response.data), 20)
+
+    def tearDown(self):
+        Payment.objects.all().delete()
+        Rental.objects.all().delete()
+        Movie.objects.all().delete()
+        User.objects.all().delete()
+
+
+def consume_tokens(path, count, allowed):
+    store = throttling.BucketStore(path, 64)
+    for _ in range(count):
+        if store.consume('shared', 0.001, 100)[0]:
+            with allowed.get_lock():
+                allowed.value += 1
+
+class ThrottleTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(username='user1', password='user1')
+        self.movies = [Movie.objects.create(title=f'Movie {i}', description='A film', year=2000, imdb_rating=7) for i in range(3)]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'throttle')
+        self.store = throttling.BucketStore(self.path, 64)
+        patches = [
+            mock.patch.object(throttling, '_store', self.store),
+            mock.patch.dict(api_settings.DEFAULT_THROTTLE_RATES, {'rent': '2/min', 'title_search': '1/min', 'login_ip': '1/min'}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def rent(self, movie, user=None):
+        request = self.factory.post(f'/movies/{movie.id}/rentals/')
+        force_authenticate(request, user=user or self.user)
+        return views.RentalListByMovie.as_view()(request, pk=movie.id)
+
+    def search(self, path, user=None):
+        request = self.factory.get(path)
+        force_authenticate(request, user=user or self.user)
+        return views.MovieList.as_view()(request)
+
+    def test_rent_throttled_per_user(self):
+        self.assertEqual(self.rent(self.movies[0]).status_code, 201)
+        self.assertEqual(self.rent(self.movies[1]).status_code, 201)
+        response = self.rent(self.movies[2])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        other = User.objects.create_user(username='user2', password='user2')
+        self.assertEqual(self.rent(self.movies[2], user=other).status_code, 201)
+
+    def test_rental_list_not_throttled(self):
+        for _ in range(3):
+            request = self.factory.get(f'/movies/{self.movies[0].id}/rentals/')
+            force_authenticate(request, user=self.user)
+            self.assertEqual(views.RentalListByMovie.as_view()(request, pk=self.movies[0].id).status_code, 200)
+
+    def test_title_search_throttled(self):
+        self.assertEqual(self.search('/movies/?title=movie').status_code, 200)
+        self.assertEqual(self.search('/movies/?title=film').status_code, 429)
+        self.assertEqual(self.search('/movies/').status_code, 200)
+        self.assertEqual(self.search('/movies/?year=2000').status_code, 200)
+
+    def test_bucket_refills(self):
+        self.search('/movies/?title=movie')
+        with mock.patch('time.time', return_value=time.time() + 60):
+            self.assertEqual(self.search('/movies/?title=movie').status_code, 200)
+
+    def test_login_throttled_per_ip(self):
+        def login(ip):
+            request = self.factory.post('/token/', {'username': 'user1', 'password': 'user1'}, format='json', REMOTE_ADDR=ip)
+            return views.TokenObtain.as_view()(request)
+        self.assertEqual(login('10.0.0.1').status_code, 200)
+        self.assertEqual(login('10.0.0.1').status_code, 429)
+        self.assertEqual(login('10.0.0.2').status_code, 200)
+
+    def test_store_shared_by_processes(self):
+        context = multiprocessing.get_context('fork')
+        allowed = context.Value('i', 0)
+        processes = [context.Process(target=consume_tokens, args=(self.path, 50, allowed)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(allowed.value, 100)
+        self.assertFalse(self.store.consume('shared', 0.001, 100)[0])
+
+    def test_least_recent_bucket_evicted(self):
+        store = throttling.BucketStore(self.path + '-small', throttling.GROUP_SLOTS)
+        for i in range(throttling.GROUP_SLOTS):
+            store.consume(f'key{i}', 0.001, 1)
+        self.assertFalse(store.consume('key1', 0.001, 1)[0])
+        store.consume('new', 0.001, 1)
+        self.assertTrue(store.consume('key0', 0.001, 1)[0])
+        store.close()
+
+    def tearDown(self):
+        self.store.close()
+        Movie.objects.all().delete()
+        User.objects.all().delete()
+
+class QueryBudgetTest(TestCase):
+    """
+    Every endpoint and method in urls.py runs a fixed number of queries.
+    The data set is large enough that a query per row breaks the budget, and
+    LargerQueryBudgetTest checks the same budgets on twice the data.
+    """
+    movies_count = 300
+    users_count = 150
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = Category.objects.bulk_create(Category(name=f'Category {i}') for i in range(12))
+        movies = Movie.objects.bulk_create(
+            Movie(title=f'Movie {i}', description=f'Description of movie {i}', year=1950 + i % 70, imdb_rating=5 + i % 5)
+            for i in range(cls.movies_count)
+        )
+        Movie.objects.update(search_vector=MOVIE_SEARCH_VECTOR)
+        through = Movie.category.through
+        through.objects.bulk_create(
+            through(movie_id=movie.id, category_id=categories[i % len(categories)].id)
+            for i, movie in enumerate(movies)
+        )
+        through.objects.bulk_create(
+            through(movie_id=movie.id, category_id=categories[(i + 1) % len(categories)].id)
+            for i, movie in enumerate(movies)
+        )
+        password = make_password('user')
+        users = User.objects.bulk_create(
+            User(username=f'user{i}', password=password) for i in range(cls.users_count)
+        )
+        cls.superuser = User.objects.create_superuser(username='admin', password='admin')
+        cls.user = users[0]
+        # every user rents the first movie and one other movie
+        rentals = Rental.objects.bulk_create(
+            [Rental(user=user, movie=movies[0]) for user in users]
+            + [Rental(user=user, movie=movies[i + 1]) for i, user in enumerate(users)]
+        )
+        Payment.objects.bulk_create(Payment(rental=rental, amount=1) for rental in rentals)
+        cls.movie = movies[0]
+        cls.other_movie = movies[-1]
+        cls.category = categories[0]
+        cls.rental = rentals[0]
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.async_factory = AsyncRequestFactory()
+        # measure the database work, not the catalog cache
+        cache.clear()
+        revocation_list.clear()
+
+    def assertQueryBudget(self, budget, view, request, user=None, **kwargs):
+        if user is not None:
+            force_authenticate(request, user=user)
+        with self.assertNumQueries(budget):
+            response = view.as_view()(request, **kwargs)
+            response.render()
+        self.assertLess(response.status_code, 400)
+        return response
+
+    def assertAsyncQueryBudget(self, budget, view, request, **kwargs):
+        async def run_in_test_thread(function, *args):
+            # the connection of the test thread sees the test data and is counted
+            return await sync_to_async(function)(*args)
+        with mock.patch.object(async_views, 'run_in_db_thread', run_in_test_thread), self.assertNumQueries(budget):
+            response = async_to_sync(view)(request, **kwargs)
+        self.assertLess(response.status_code, 400)
+        return response
+
+    def test_movie_list_get(self):
+        self.assertQueryBudget(2, views.MovieList, self.factory.get('/movies/'))
+
+    def test_movie_list_get_filtered(self):
+        request = self.factory.get('/movies/?title=movie&category=Category 1&q=movie')
+        self.assertQueryBudget(2, views.MovieList, request)
+
+    def test_movie_list_post(self):
+        data = {'title': 'New', 'description': 'New movie', 'year': 2020, 'imdb_rating': 7.0, 'category': [self.category.id]}
+        request = self.factory.post('/movies/', data, format='json')
+        self.assertQueryBudget(8, views.MovieList, request, user=self.superuser)
+
+    def test_movie_bulk_post(self):
+        data = [
+            {'title': f'New {i}', 'description': 'New movie', 'year': 2020, 'imdb_rating': 7.0, 'category': [self.category.id]}
+            for i in range(100)
+        ]
+        request = self.factory.post('/movies/bulk/', data, format='json')
+        self.assertQueryBudget(6, views.MovieBulk, request, user=self.superuser)
+
+    def test_movie_bulk_put(self):
+        movies = Movie.objects.order_by('id')[:100]
+        data = [
+            {'id': movie.id, 'title': movie.title, 'description': 'Updated', 'year': 2020, 'imdb_rating': 7.0, 'category': [self.category.id]}
+            for movie in movies
+        ]
+        request = self.factory.put('/movies/bulk/', data, format='json')
+        self.assertQueryBudget(8, views.MovieBulk, request, user=self.superuser)
+
+    def test_movie_bulk_delete(self):
+        ids = list(Movie.objects.order_by('-id').values_list('id', flat=True)[:100])
+        request = self.factory.delete('/movies/bulk/', ids, format='json')
+        self.assertQueryBudget(7, views.MovieBulk, request, user=self.superuser)
+
+    def test_movie_list_get_cached(self):
+        views.MovieList.as_view()(self.factory.get('/movies/'))
+        self.assertQueryBudget(0, views.MovieList, self.factory.get('/movies/'))
+
+    def test_movie_autocomplete_get(self):
+        request = self.factory.get('/movies/autocomplete/?q=movie 1')
+        self.assertQueryBudget(1, views.MovieAutocomplete, request)
+
+    def test_movie_detail_get(self):
+        request = self.factory.get(f'/movies/{self.movie.id}/')
+        self.assertQueryBudget(3, views.MovieDetail, request, pk=self.movie.id)
+
+    def test_movie_detail_put(self):
+        data = {'title': 'Edited', 'description': 'Edited movie', 'year': 2020, 'imdb_rating': 7.0, 'category': [self.category.id]}
+        request = self.factory.put(f'/movies/{self.movie.id}/', data, format='json')
+        self.assertQueryBudget(8, views.MovieDetail, request, user=self.superuser, pk=self.movie.id)
+
+    def test_movie_detail_delete(self):
+        request = self.factory.delete(f'/movies/{self.movie.id}/')
+        self.assertQueryBudget(8, views.MovieDetail, request, user=self.superuser, pk=self.movie.id)
+        self.assertFalse(Rental.objects.filter(movie_id=self.movie.id).exists())
+        self.assertFalse(Payment.objects.filter(rental__movie_id=self.movie.id).exists())
+
+    def test_category_list_get(self):
+        self.assertQueryBudget(2, views.CategoryList, self.factory.get('/categories/'))
+
+    def test_category_list_post(self):
+        request = self.factory.post('/categories/', {'name': 'New'}, format='json')
+        self.assertQueryBudget(1, views.CategoryList, request, user=self.superuser)
+
+    def test_category_detail_get(self):
+        request = self.factory.get(f'/categories/{self.category.id}/')
+        self.assertQueryBudget(2, views.CategoryDetail, request, pk=self.category.id)
+
+    def test_category_detail_put(self):
+        request = self.factory.put(f'/categories/{self.category.id}/', {'name': 'Edited'}, format='json')
+        self.assertQueryBudget(2, views.CategoryDetail, request, user=self.superuser, pk=self.category.id)
+
+    def test_category_detail_delete(self):
+        request = self.factory.delete(f'/categories/{self.category.id}/')
+        self.assertQueryBudget(4, views.CategoryDetail, request, user=self.superuser, pk=self.category.id)
+
+    def test_movie_list_by_category_get(self):
+        request = self.factory.get(f'/categories/{self.category.id}/movies/')
+        self.assertQueryBudget(3, views.MovieListByCategory, request, pk=self.category.id)
+
+    def test_rental_list_get_superuser(self):
+        request = self.factory.get('/rentals/')
+        self.assertQueryBudget(1, views.RentalList, request, user=self.superuser)
+
+    def test_rental_list_get_user(self):
+        request = self.factory.get(f'/rentals/?movie={self.movie.title}')
+        self.assertQueryBudget(1, views.RentalList, request, user=self.user)
+
+    def test_rental_detail_get(self):
+        request = self.factory.get(f'/rentals/{self.rental.id}/')
+        self.assertQueryBudget(1, views.RentalDetail, request, user=self.user, pk=self.rental.id)
+
+    def test_rental_detail_delete(self):
+        request = self.factory.delete(f'/rentals/{self.rental.id}/')
+        self.assertQueryBudget(3, views.RentalDetail, request, user=self.user, pk=self.rental.id)
+
+    def test_rental_list_by_movie_get_superuser(self):
+        request = self.factory.get(f'/movies/{self.movie.id}/rentals/')
+        self.assertQueryBudget(1, views.RentalListByMovie, request, user=self.superuser, pk=self.movie.id)
+
+    def test_rental_list_by_movie_get_user(self):
+        request = self.factory.get(f'/movies/{self.movie.id}/rentals/')
+        self.assertQueryBudget(1, views.RentalListByMovie, request, user=self.user, pk=self.movie.id)
+
+    def test_rental_list_by_movie_post(self):
+        request = self.factory.post(f'/movies/{self.other_movie.id}/rentals/', {}, format='json')
+        self.assertQueryBudget(1, views.RentalListByMovie, request, user=self.user, pk=self.other_movie.id)
+
+    def test_payment_list_get_superuser(self):
+        request = self.factory.get('/payments/')
+        self.assertQueryBudget(1, views.PaymentList, request, user=self.superuser)
+
+    def test_payment_list_get_user(self):
+        request = self.factory.get('/payments/')
+        self.assertQueryBudget(1, views.PaymentList, request, user=self.user)
+
+    def test_payment_list_by_movie_get(self):
+        request = self.factory.get(f'/movies/{self.movie.id}/payments/')
+        self.assertQueryBudget(2, views.PaymentListByMovie, request, user=self.superuser, pk=self.movie.id)
+
+    def test_payment_list_by_movie_post(self):
+        request = self.factory.post(f'/movies/{self.movie.id}/payments/', {'amount': 1}, format='json')
+        self.assertQueryBudget(5, views.PaymentListByMovie, request, user=self.user, pk=self.movie.id)
+
+    def test_payment_list_by_movie_post_idempotent(self):
+        request = self.factory.post(f'/movies/{self.movie.id}/payments/', {'amount': 1}, format='json', HTTP_IDEMPOTENCY_KEY='key')
+        self.assertQueryBudget(9, views.PaymentListByMovie, request, user=self.user, pk=self.movie.id)
+        request = self.factory.post(f'/movies/{self.movie.id}/payments/', {'amount': 1}, format='json', HTTP_IDEMPOTENCY_KEY='key')
+        self.assertQueryBudget(4, views.PaymentListByMovie, request, user=self.user, pk=self.movie.id)
+
+    def test_user_list_get_superuser(self):
+        request = self.factory.get('/users/')
+        self.assertQueryBudget(1, views.UserList, request, user=self.superuser)
+
+    def test_user_list_get_user(self):
+        request = self.factory.get('/users/')
+        self.assertQueryBudget(1, views.UserList, request, user=self.user)
+
+    def test_user_list_post(self):
+        request = self.factory.post('/users/', {'username': 'new', 'password': 'new'}, format='json')
+        self.assertQueryBudget(2, views.UserList, request)
+
+    def test_user_detail_get(self):
+        request = self.factory.get(f'/users/{self.user.id}/')
+        self.assertQueryBudget(1, views.UserDetail, request, user=self.superuser, pk=self.user.id)
+
+    def test_user_detail_put(self):
+        request = self.factory.put(f'/users/{self.user.id}/', {'username': 'edited', 'password': 'edited'}, format='json')
+        self.assertQueryBudget(3, views.UserDetail, request, user=self.user, pk=self.user.id)
+
+    def test_user_detail_delete(self):
+        request = self.factory.delete(f'/users/{self.user.id}/')
+        self.assertQueryBudget(9, views.UserDetail, request, user=self.superuser, pk=self.user.id)
+
+    def test_rental_quote_get(self):
+        request = self.factory.get('/rentals/quote/')
+        self.assertQueryBudget(1, views.RentalQuote, request, user=self.user)
+
+    def test_payment_export_get(self):
+        request = self.factory.get('/payments/export/')
+        force_authenticate(request, user=self.superuser)
+        with self.assertNumQueries(1):
+            response = views.PaymentExport.as_view()(request)
+            self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 2 * self.users_count)
+
+    def test_rental_export_get(self):
+        request = self.factory.get('/rentals/export/?format=csv')
+        force_authenticate(request, user=self.superuser)
+        with self.assertNumQueries(1):
+            response = views.RentalExport.as_view()(request)
+            self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 2 * self.users_count + 1)
+
+    def test_token_obtain(self):
+        request = self.factory.post('/token/', {'username': 'admin', 'password': 'admin'}, format='json')
+        self.assertQueryBudget(1, views.TokenObtain, request)
+
+    def test_token_refresh(self):
+        refresh = str(RefreshToken.for_user(self.user))
+        request = self.factory.post('/token/refresh/', {'refresh': refresh}, format='json')
+        # the revoked tokens are read at most every TOKEN_REVOCATION_REFRESH seconds
+        self.assertQueryBudget(1, views.TokenRefresh, request)
+        request = self.factory.post('/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertQueryBudget(0, views.TokenRefresh, request)
+
+    def test_token_revoke(self):
+        refresh = RefreshToken.for_user(self.user)
+        request = self.factory.post('/token/revoke/', {'refresh': str(refresh)}, format='json')
+        force_authenticate(request, user=self.user, token=refresh.access_token)
+        self.assertQueryBudget(1, views.TokenRevoke, request)
+
+    def test_async_movie_list_get(self):
+        self.assertAsyncQueryBudget(2, async_views.movie_list, self.async_factory.get('/async/movies/'))
+
+    def test_async_movie_list_get_filtered(self):
+        request = self.async_factory.get('/async/movies/?title=movie&category=Category 1&q=movie')
+        self.assertAsyncQueryBudget(2, async_views.movie_list, request)
+
+    def test_async_movie_detail_get(self):
+        request = self.async_factory.get(f'/async/movies/{self.movie.id}/')
+        self.assertAsyncQueryBudget(3, async_views.movie_detail, request, pk=self.movie.id)
+
+    def test_async_category_list_get(self):
+        self.assertAsyncQueryBudget(2, async_views.category_list, self.async_factory.get('/async/categories/'))
+
+    def test_async_movie_list_by_category_get(self):
+        request = self.async_factory.get(f'/async/categories/{self.category.id}/movies/')
+        self.assertAsyncQueryBudget(3, async_views.movie_list_by_category, request, pk=self.category.id)
+
+class LargerQueryBudgetTest(QueryBudgetTest):
+    movies_count = 600
+    users_count = 300
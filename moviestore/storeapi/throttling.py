@@ -0,0 +1,172 @@
+"""
+Token bucket throttling shared by the worker processes of a host.
+
+A view opts in with a throttle_scope. UserTokenBucketThrottle limits every
+user (anonymous users by IP) to the THROTTLE_RATES of the scope, and
+IPTokenBucketThrottle every IP to the rate of '<scope>_ip'; a scope without a
+rate is not throttled. A rate of 30/min is a bucket of 30 requests refilled at
+one request every two seconds, so short bursts pass and a steady flood waits.
+
+The buckets live in a memory mapped file (THROTTLE_FILE) open in every
+process, a fixed table of THROTTLE_SLOTS slots locked per group of slots with
+fcntl. A request costs a hash and two system calls, and no network round trip.
+When every slot of a group is taken the least recently used bucket is reset.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from types import SimpleNamespace
+from django.conf import settings
+from rest_framework.exceptions import Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+# key hash (0 for a free slot), tokens, refilled at (epoch seconds)
+SLOT = struct.Struct('=Qdd')
+# slots a key can take, locked together
+GROUP_SLOTS = 4
+
+
+class BucketStore:
+    """
+    Token buckets in a memory mapped file.
+    """
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.groups = max(slots // GROUP_SLOTS, 1)
+        self.size = self.groups * GROUP_SLOTS * SLOT.size
+        # fcntl locks are held by the process, the threads take turns first
+        self.lock = threading.Lock()
+        self.fd = None
+        self.map = None
+
+    def open(self):
+        with self.lock:
+            if self.map is None:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                if os.fstat(fd).st_size < self.size:
+                    os.ftruncate(fd, self.size)
+                self.map = mmap.mmap(fd, self.size)
+                self.fd = fd
+
+    def close(self):
+        with self.lock:
+            if self.map is not None:
+                self.map.close()
+                os.close(self.fd)
+                self.map = self.fd = None
+
+    def clear(self):
+        self.open()
+        with self.lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX)
+            try:
+                self.map[:] = bytes(self.size)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+    def consume(self, key, rate, capacity):
+        """
+        Take a token from the bucket of key, holding at most capacity tokens
+        and refilled with rate tokens per second. Return whether there was one
+        and the seconds until there is.
+        """
+        if self.map is None:
+            self.open()
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+        key_hash = digest or 1
+        start = (digest % self.groups) * GROUP_SLOTS * SLOT.size
+        length = GROUP_SLOTS * SLOT.size
+        now = time.time()
+        with self.lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, length, start)
+            try:
+                slots = [(offset, *SLOT.unpack_from(self.map, offset)) for offset in range(start, start + length, SLOT.size)]
+                found = next((slot for slot in slots if slot[1] == key_hash), None)
+                if found is not None:
+                    offset, _, tokens, refilled_at = found
+                    tokens = min(capacity, tokens + max(now - refilled_at, 0) * rate)
+                else:
+                    # a free slot has never been refilled, so it is the least recent
+                    offset = min(slots, key=lambda slot: slot[3])[0]
+                    tokens = capacity
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                SLOT.pack_into(self.map, offset, key_hash, tokens, now)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, length, start)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+
+_store = None
+
+
+def bucket_store():
+    global _store
+    if _store is None:
+        _store = BucketStore(settings.THROTTLE_FILE, settings.THROTTLE_SLOTS)
+    return _store
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Throttle of the scope of the view, with scope_suffix, in the bucket store.
+    """
+    scope_suffix = ''
+
+    def __init__(self):
+        # the scope and its rate are known once the view is
+        pass
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scope', None)
+        if self.scope is None:
+            return True
+        self.scope += self.scope_suffix
+        self.rate = api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        allowed, self.wait_time = bucket_store().consume(self.key, self.num_requests / self.duration, self.num_requests)
+        return allowed
+
+    def wait(self):
+        return self.wait_time
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    scope_suffix = '_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+def check_throttles(request, scope):
+    """
+    Apply the throttles of scope to a DRF request outside of APIView, like
+    APIView.check_throttles.
+    """
+    view = SimpleNamespace(throttle_scope=scope)
+    throttles = [throttle_class() for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES]
+    waits = [throttle.wait() for throttle in throttles if not throttle.allow_request(request, view)]
+    if waits:
+        raise Throttled(max(waits))
@@ -1,23 +1,29 @@
 from django.urls import include, path
-from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
-    TokenRefreshView,
-)
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('movies/', views.MovieList.as_view()),
+    path('movies/autocomplete/', views.MovieAutocomplete.as_view()),
+    path('movies/bulk/', views.MovieBulk.as_view()),
     path('movies/<int:pk>/', views.MovieDetail.as_view()),
     path('categories/', views.CategoryList.as_view()),
     path('categories/<int:pk>/', views.CategoryDetail.as_view()),
     path('categories/<int:pk>/movies/', views.MovieListByCategory.as_view()),
     path('rentals/', views.RentalList.as_view()),
+    path('rentals/quote/', views.RentalQuote.as_view()),
+    path('rentals/export/', views.RentalExport.as_view()),
     path('rentals/<int:pk>/', views.RentalDetail.as_view()),
     path('movies/<int:pk>/rentals/', views.RentalListByMovie.as_view()),
     path('payments/', views.PaymentList.as_view()),
+    path('payments/export/', views.PaymentExport.as_view()),
     path('movies/<int:pk>/payments/', views.PaymentListByMovie.as_view()),
     path('users/', views.UserList.as_view()),
     path('users/<int:pk>/', views.UserDetail.as_view()),
-    path('token/', TokenObtainPairView.as_view()),
-    path('token/refresh/', TokenRefreshView.as_view()),
+    path('token/', views.TokenObtain.as_view()),
+    path('token/refresh/', views.TokenRefresh.as_view()),
+    path('token/revoke/', views.TokenRevoke.as_view()),
+    path('async/movies/', async_views.movie_list),
+    path('async/movies/<int:pk>/', async_views.movie_detail),
+    path('async/categories/', async_views.category_list),
+    path('async/categories/<int:pk>/movies/', async_views.movie_list_by_category),
 ]
\ No newline at end of file
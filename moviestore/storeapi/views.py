@@ -1,4 +1,4 @@
-import datetime
+from operator import itemgetter
 from django.shortcuts import render
 from django.conf import settings
 from django.utils import timezone
@@ -6,32 +6,73 @@ from django.contrib.auth.models import User
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, filters, generics
-from django.http import Http404
-from .serializers import MovieSerializer, CategorySerializer, RentalSerializer, PaymentSerializer, UserSerializer
+from django.http import Http404, StreamingHttpResponse
+from django.db import transaction
+from django.db.models import F
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from rest_framework_simplejwt.tokens import Token
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from .serializers import MovieSerializer, MovieRowSerializer, MovieBulkSerializer, MovieBulkListSerializer, CategorySerializer, RentalSerializer, PaymentSerializer, UserSerializer, TokenRefreshSerializer, TokenRevokeSerializer
 from .models import Category, Movie, Rental, Payment
+from .pagination import paginated_response
+from .cache import bump_catalog_version, catalog_cached
+from .renderers import NDJSONRenderer, CSVRenderer
+from .conditional import conditional_get
+from .routers import replica_reads
+from .idempotency import idempotent
+from .pricing import default_pricing, rental_days
+from .revocation import revoke
+from .db import iterate_rows
+
+def filter_movies(params):
+    """
+    Return the movies matching the query parameters and their ordering.
+    """
+    q = params.get('q', None)
+    title = params.get('title', None)
+    description = params.get('description', None)
+    category = params.get('category', None)
+    year = params.get('year', None)
+    queryset = Movie.objects.all()
+    ordering = None
+    if q:
+        # full text search, best matches first
+        query = SearchQuery(q, search_type='websearch', config='english')
+        queryset = queryset.filter(search_vector=query).annotate(rank=SearchRank(F('search_vector'), query))
+        ordering = ('-rank', '-id')
+    if title:
+        queryset = queryset.filter(title__icontains=title)
+    if description:
+        queryset = queryset.filter(description__icontains=description)
+    if category:
+        # a subquery keeps the join free for the category ids of the movies
+        queryset = queryset.filter(pk__in=Movie.category.through.objects.filter(category__name=category).values('movie_id'))
+    if year:
+        queryset = queryset.filter(year=year)
+    return queryset, ordering
 
 class MovieList(APIView):
+    throttle_scope = 'title_search'
+
+    def get_throttles(self):
+        # the title search scans the titles, the other requests are cheap or cached
+        if self.request.method == 'GET' and self.request.query_params.get('title'):
+            return super().get_throttles()
+        return []
+
+    def filter_queryset(self, request):
+        return filter_movies(request.query_params)
 
+    def validator_queryset(self, request):
+        return self.filter_queryset(request)[0]
+
+    @replica_reads
+    @catalog_cached
+    @conditional_get
     def get(self, request, format=None):
-        if request.query_params:
-            title = request.query_params.get('title', None)
-            description = request.query_params.get('description', None)
-            category = request.query_params.get('category', None)
-            year = request.query_params.get('year', None)
-            queryset = Movie.objects.all()
-            if title:
-                queryset = queryset.filter(title__icontains=title)
-            if description:
-                queryset = queryset.filter(description__icontains=description)
-            if category:
-                queryset = queryset.filter(category__name=category)
-            if year:
-                queryset = queryset.filter(year=year)
-            serializer = MovieSerializer(queryset, many=True)
-            return Response(serializer.data)
-        else:
-            serializer = MovieSerializer(Movie.objects.all(), many=True)
-            return Response(serializer.data)
+        queryset, ordering = self.filter_queryset(request)
+        queryset = MovieRowSerializer.setup_queryset(queryset, ordering)
+        return paginated_response(request, queryset, MovieRowSerializer, self, ordering)
 
     def post(self, request, format=None):
         serializer = MovieSerializer(data=request.data)
@@ -41,11 +82,87 @@ class MovieList(APIView):
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         return Response(status=status.HTTP_401_UNAUTHORIZED)
+
+class MovieBulk(APIView):
+    """
+    Create, update or delete a list of movies in one transaction.
+    """
+
+    def post(self, request, format=None):
+        if request.user.is_superuser:
+            serializer = MovieBulkSerializer(data=request.data, many=True)
+            return self.write(serializer, status.HTTP_201_CREATED)
+        return Response(status=status.HTTP_401_UNAUTHORIZED)
+
+    def put(self, request, format=None):
+        if request.user.is_superuser:
+            serializer = MovieBulkSerializer(Movie.objects.all(), data=request.data, many=True)
+            return self.write(serializer, status.HTTP_200_OK)
+        return Response(status=status.HTTP_401_UNAUTHORIZED)
+
+    def delete(self, request, format=None):
+        if request.user.is_superuser:
+            ids = request.data
+            # json true and false are bools, which are ints in python
+            if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+                return Response({'non_field_errors': ['Expected a list of movie ids.']}, status=status.HTTP_400_BAD_REQUEST)
+            max_items = MovieBulkListSerializer.max_items
+            if len(ids) > max_items:
+                return Response(
+                    {'non_field_errors': [f'Ensure this list has no more than {max_items} items.']},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            with transaction.atomic():
+                found = set(Movie.objects.filter(pk__in=ids).values_list('pk', flat=True))
+                Movie.objects.filter(pk__in=found).delete_with_rentals()
+            # bulk writes send no signals
+            bump_catalog_version()
+            results = [
+                {'id': pk, 'status': status.HTTP_204_NO_CONTENT if pk in found else status.HTTP_404_NOT_FOUND}
+                for pk in ids
+            ]
+            return Response(results)
+        return Response(status=status.HTTP_401_UNAUTHORIZED)
+
+    def write(self, serializer, item_status):
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            movies = serializer.save()
+        # bulk writes send no signals
+        bump_catalog_version()
+        return Response([{'id': movie.pk, 'status': item_status} for movie in movies], status=item_status)
+
+class MovieAutocomplete(APIView):
+    max_limit = 20
+
+    def get(self, request, format=None):
+        q = request.query_params.get('q', '').strip()
+        if not q:
+            return Response([])
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), self.max_limit)
+        except ValueError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        # the trigram index on title serves the word similarity filter
+        movies = (
+            Movie.objects.filter(title__trigram_word_similar=q)
+            .annotate(similarity=TrigramWordSimilarity(q, 'title'))
+            .order_by('-similarity', 'title')
+            .values('id', 'title')[:max(limit, 1)]
+        )
+        return Response(list(movies))
+
 class MovieDetail(APIView):
 
+    def validator_queryset(self, request, pk):
+        return Movie.objects.filter(pk=pk)
+
+    @catalog_cached
+    @conditional_get
     def get(self, request, pk, format=None):
         try:
-            movie = Movie.objects.get(pk=pk)
+            movie = MovieSerializer.setup_eager_loading(Movie.objects.all()).get(pk=pk)
         except Movie.DoesNotExist:
             raise Http404
         serializer = MovieSerializer(movie)
@@ -70,15 +187,23 @@ class MovieDetail(APIView):
                 movie = Movie.objects.get(pk=pk)
             except Movie.DoesNotExist:
                 raise Http404
-            movie.delete()
+            with transaction.atomic():
+                # a movie has many rentals, delete them without the collector
+                Rental.objects.filter(movie=movie).delete_with_payments()
+                movie.delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_401_UNAUTHORIZED)
 
 class CategoryList(APIView):
 
+    def validator_queryset(self, request):
+        return Category.objects.all()
+
+    @replica_reads
+    @catalog_cached
+    @conditional_get
     def get(self, request, format=None):
-        serializer = CategorySerializer(Category.objects.all(), many=True)
-        return Response(serializer.data)
+        return Response(list(Category.objects.values(*CategorySerializer.Meta.fields)))
     
     def post(self, request, format=None):
         if request.user.is_superuser:
@@ -91,6 +216,11 @@ class CategoryList(APIView):
 
 class CategoryDetail(generics.RetrieveUpdateDestroyAPIView):
 
+    def validator_queryset(self, request, pk):
+        return Category.objects.filter(pk=pk)
+
+    @catalog_cached
+    @conditional_get
     def get(self, request, pk, format=None):
         try:
             category = Category.objects.get(pk=pk)
@@ -128,59 +258,51 @@ class MovieListByCategory(APIView):
         except Category.DoesNotExist:
             raise Http404
 
+    def validator_queryset(self, request, pk):
+        return Movie.objects.filter(category=pk)
+
+    @catalog_cached
+    @conditional_get
     def get(self, request, pk, format=None):
         category = self.get_object(pk)
-        movies = Movie.objects.filter(category=category)
-        serializer = MovieSerializer(movies, many=True)
-        return Response(serializer.data)
+        movies = Movie.objects.filter(pk__in=Movie.category.through.objects.filter(category=category).values('movie_id'))
+        return paginated_response(request, MovieRowSerializer.setup_queryset(movies), MovieRowSerializer, self)
 
 class RentalList(APIView):
+    @replica_reads
     def get(self, request,format=None):
         if request.user.is_superuser:
             if request.query_params:
                 user = request.query_params.get('user', None)
                 movie = request.query_params.get('movie', None)
-                queryset = Rental.objects.all()
+                queryset = Rental.objects.with_price()
                 if user:
                     queryset = queryset.filter(user__name__icontains=user)
                 if movie:
                     queryset = queryset.filter(movie__title__icontains=movie)
                 
-                serializer = RentalSerializer(queryset, many=True)
-                return Response(serializer.data)
+                return paginated_response(request, queryset, RentalSerializer, self)
             else:
-                serializer = RentalSerializer(Rental.objects.all(), many=True)
-                return Response(serializer.data)
+                return paginated_response(request, Rental.objects.with_price(), RentalSerializer, self)
         if request.user.is_authenticated:
             if request.query_params:
                 movie = request.query_params.get('movie', None)
-                queryset = Rental.objects.filter(user=request.user)
+                queryset = Rental.objects.with_price().filter(user=request.user)
                 if movie:
                     queryset = queryset.filter(movie__title__icontains=movie)
-                serializer = RentalSerializer(queryset, many=True)
-                return Response(serializer.data)
+                return paginated_response(request, queryset, RentalSerializer, self)
             else:
-                serializer = RentalSerializer(Rental.objects.all(), many=True)
-                return Response(serializer.data)
+                return paginated_response(request, Rental.objects.with_price(), RentalSerializer, self)
         return Response(status=status.HTTP_401_UNAUTHORIZED)
 
 class RentalDetail(APIView):
     
     def get(self, request, pk, format=None):
         try:
-            rental = Rental.objects.get(pk=pk)
+            rental = Rental.objects.with_price().get(pk=pk)
         except Rental.DoesNotExist:
             raise Http404
-        if request.user.is_superuser or rental.user == request.user:
-            days = (datetime.datetime.now().date() - rental.rented_at.date()).days
-            if days == 0:
-                rental.price = 1
-            elif days <= 3:
-                rental.price = days
-            else:
-                rental.price = 3 + (days - 3) * 0.5
-            rental.save()
-            rental = Rental.objects.get(pk=pk)
+        if request.user.is_superuser or rental.user_id == request.user.pk:
             serializer = RentalSerializer(rental)
             return Response(serializer.data)
         return Response(status=status.HTTP_401_UNAUTHORIZED)
@@ -190,138 +312,219 @@ class RentalDetail(APIView):
             rental = Rental.objects.get(pk=pk)
         except Rental.DoesNotExist:
             raise Http404
-        if request.user.is_superuser or rental.user == request.user:
+        if request.user.is_superuser or rental.user_id == request.user.pk:
             rental.delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_401_UNAUTHORIZED)
 
+class RentalQuote(APIView):
+    """
+    Amount due today for many rentals, by default the open rentals of the user.
+    """
+    max_rentals = 500
+
+    def get(self, request, format=None):
+        if not request.user.is_authenticated:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        ids = request.query_params.get('ids', None)
+        if ids:
+            try:
+                ids = [int(i) for i in ids.split(',')]
+            except ValueError:
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            if len(ids) > self.max_rentals:
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            rentals = Rental.objects.filter(pk__in=ids)
+            if not request.user.is_superuser:
+                rentals = rentals.filter(user=request.user)
+        else:
+            rentals = Rental.objects.filter(user=request.user, activated=False)
+        rows = list(rentals.order_by('id').values_list('id', 'rented_at')[:self.max_rentals])
+        days = rental_days([rented_at for _, rented_at in rows], timezone.now())
+        prices = default_pricing().quote(days)
+        return Response([
+            {'id': row[0], 'days': int(day), 'price': float(price)}
+            for row, day, price in zip(rows, days, prices)
+        ])
+
 class RentalListByMovie(APIView):
+    throttle_scope = 'rent'
+
+    def get_throttles(self):
+        if self.request.method == 'POST':
+            return super().get_throttles()
+        return []
 
     def get(self, request, pk, format=None):
-        movie = Movie.objects.get(pk=pk)
         if request.user.is_superuser:
-            rentals = Rental.objects.filter(movie=movie)
-            # for each rental calculate the price
-            for rental in rentals:
-                days = (datetime.datetime.now().date() - rental.rented_at.date()).days
-                if days == 0:
-                    rental.price = 1
-                elif days <= 3:
-                    rental.price = days
-                else:
-                    rental.price = 3 + (days - 3) * 0.5
-                rental.save()
-            rentals = Rental.objects.filter(movie=movie)         
+            rentals = Rental.objects.with_price().filter(movie_id=pk)
             serializer = RentalSerializer(rentals, many=True)
             return Response(serializer.data)
         if request.user.is_authenticated:
-            rentals = Rental.objects.filter(user=request.user, movie=movie)
-            for rental in rentals:
-                days = (datetime.datetime.now().date() - rental.rented_at.date()).days
-                if days == 0:
-                    rental.price = 1
-                elif days <= 3:
-                    rental.price = days
-                else:
-                    rental.price = 3 + (days - 3) * 0.5
-                rental.save()
-            rentals = Rental.objects.filter(user=request.user, movie=movie)
+            rentals = Rental.objects.with_price().filter(user=request.user, movie_id=pk)
             serializer = RentalSerializer(rentals, many=True)
             return Response(serializer.data)
         return Response(status=status.HTTP_401_UNAUTHORIZED)
     
     def post(self, request, pk, format=None):
         if request.user.is_authenticated:
-            movie = Movie.objects.get(pk=pk)
-            if not Rental.objects.filter(movie=movie, user=request.user).exists():
-                rental = Rental(movie=movie, user=request.user)
-                rental.save()
+            if Rental.objects.rent(request.user, pk) is not None:
                 return Response(status=status.HTTP_201_CREATED)
-            else:
-                return Response(status=status.HTTP_400_BAD_REQUEST)
+            if not Movie.objects.filter(pk=pk).exists():
+                raise Http404
+            return Response(status=status.HTTP_400_BAD_REQUEST)
         return Response(status=status.HTTP_401_UNAUTHORIZED)
 
 
 class PaymentList(APIView):    
+    @replica_reads
     def get(self, request, format=None):
         if request.user.is_superuser:
             if request.query_params:
                 user = request.query_params.get('user', None)
                 movie = request.query_params.get('movie', None)
-                queryset = Payment.objects.all()
+                queryset = PaymentSerializer.setup_eager_loading(Payment.objects.all())
                 if user:
                     queryset = queryset.filter(user__name__icontains=user)
                 if movie:
                     queryset = queryset.filter(movie__title__icontains=movie)
-                serializer = PaymentSerializer(queryset, many=True)
-                return Response(serializer.data)
+                return paginated_response(request, queryset, PaymentSerializer, self)
             else:
-                serializer = PaymentSerializer(Payment.objects.all(), many=True)
-                return Response(serializer.data)
+                queryset = PaymentSerializer.setup_eager_loading(Payment.objects.all())
+                return paginated_response(request, queryset, PaymentSerializer, self)
         if request.user.is_authenticated:
             if request.query_params:
                 movie = request.query_params.get('movie', None)
-                queryset = Payment.objects.filter(user=request.user)
+                queryset = PaymentSerializer.setup_eager_loading(Payment.objects.filter(user=request.user))
                 if movie:
                     queryset = queryset.filter(movie__title__icontains=movie)
-                serializer = PaymentSerializer(queryset, many=True)
-                return Response(serializer.data)
+                return paginated_response(request, queryset, PaymentSerializer, self)
             else:
-                serializer = PaymentSerializer(Payment.objects.all(), many=True)
-                return Response(serializer.data)
+                queryset = PaymentSerializer.setup_eager_loading(Payment.objects.all())
+                return paginated_response(request, queryset, PaymentSerializer, self)
         return Response(status=status.HTTP_401_UNAUTHORIZED)
 
+class ExportView(APIView):
+    """
+    Streams rows as NDJSON (default) or CSV, chosen with the Accept header or
+    ?format=ndjson|csv. Rows are read chunk_size at a time, with a server side
+    cursor or by keyset behind a pooler, so memory use does not depend on the
+    number of rows.
+
+    Base class without a URL: a subclass sets fields, (column, lookup path)
+    pairs, and implements get_queryset(request) returning the rows the user
+    may export.
+    """
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+    chunk_size = 2000
+    filename = 'export'
+    fields = ()
+
+    def get(self, request, format=None):
+        if not request.user.is_authenticated:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        columns = [column for column, _ in self.fields]
+        # the pk first, to read the next chunk after the last row
+        rows = self.get_queryset(request).values_list('pk', *[path for _, path in self.fields])
+        rows = (row[1:] for row in iterate_rows(rows, self.chunk_size, key=itemgetter(0)))
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(columns, rows),
+            content_type=renderer.media_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename="{self.filename}.{renderer.format}"'
+        return response
+
+class RentalExport(ExportView):
+    filename = 'rentals'
+    fields = (
+        ('id', 'id'),
+        ('user', 'user__username'),
+        ('movie', 'movie__title'),
+        ('rented_at', 'rented_at'),
+        ('activated', 'activated'),
+        ('price', 'price'),
+    )
+
+    def get_queryset(self, request):
+        queryset = Rental.objects.all()
+        user = request.query_params.get('user', None)
+        movie = request.query_params.get('movie', None)
+        if not request.user.is_superuser:
+            queryset = queryset.filter(user=request.user)
+        elif user:
+            queryset = queryset.filter(user__username__icontains=user)
+        if movie:
+            queryset = queryset.filter(movie__title__icontains=movie)
+        return queryset
+
+class PaymentExport(ExportView):
+    filename = 'payments'
+    fields = (
+        ('id', 'id'),
+        ('rental', 'rental_id'),
+        ('user', 'rental__user__username'),
+        ('movie', 'rental__movie__title'),
+        ('amount', 'amount'),
+        ('created_at', 'created_at'),
+    )
+
+    def get_queryset(self, request):
+        queryset = Payment.objects.all()
+        user = request.query_params.get('user', None)
+        movie = request.query_params.get('movie', None)
+        if not request.user.is_superuser:
+            queryset = queryset.filter(rental__user=request.user)
+        elif user:
+            queryset = queryset.filter(rental__user__username__icontains=user)
+        if movie:
+            queryset = queryset.filter(rental__movie__title__icontains=movie)
+        return queryset
+
 class PaymentListByMovie(APIView):
 
     def get(self, request, pk, format=None):
         movie = Movie.objects.get(pk=pk)
         if request.user.is_superuser:
             # retrieve all payments for all rentals of the movie
-            payments = Payment.objects.filter(rental__movie=movie)
+            payments = PaymentSerializer.setup_eager_loading(Payment.objects.filter(rental__movie=movie))
             serializer = PaymentSerializer(payments, many=True)
             return Response(serializer.data)
         if request.user.is_authenticated:
-            payments = Payment.objects.filter(rental__user=request.user, rental__movie=movie)
+            payments = PaymentSerializer.setup_eager_loading(Payment.objects.filter(rental__user=request.user, rental__movie=movie))
             serializer = PaymentSerializer(payments, many=True)
             return Response(serializer.data)
         return Response(status=status.HTTP_401_UNAUTHORIZED)
     
+    @idempotent
     def post(self, request, pk, format=None):
         if request.user.is_authenticated:
-            movie = Movie.objects.get(pk=pk)
-            if Rental.objects.filter(movie=movie, user=request.user).exists():
-                rental = Rental.objects.get(movie=movie, user=request.user)
-                days = (datetime.datetime.now().date() - rental.rented_at.date()).days
-                if days == 0:
-                    price = 1
-                elif days <= 3:
-                    price = days
-                else:
-                    price = 3 + (days - 3) * 0.5
-                rental.price = price
-                rental.save()
-                serializer = PaymentSerializer(data=request.data)
-                if serializer.is_valid():
-                    if serializer.validated_data['amount'] == price:
-                        payment = Payment(rental=rental, amount=price)
-                        payment.save()
-                        rental.activated = True
-                        rental.save()
-                        return Response(status=status.HTTP_201_CREATED)
-                    else:
-                        return Response(status=status.HTTP_400_BAD_REQUEST)
-            return Response(status=status.HTTP_400_BAD_REQUEST)
+            serializer = PaymentSerializer(data=request.data)
+            if not serializer.is_valid():
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            with transaction.atomic():
+                # the lock makes concurrent payments of the rental wait, the later ones find it settled
+                rental = (
+                    Rental.objects.with_price().select_for_update()
+                    .filter(movie_id=pk, user=request.user, activated=False).first()
+                )
+                if rental is None or serializer.validated_data['amount'] != rental.current_price:
+                    return Response(status=status.HTTP_400_BAD_REQUEST)
+                Payment.objects.create(rental=rental, amount=rental.current_price)
+                # the price is only persisted when the rental is settled
+                rental.price = rental.current_price
+                rental.activated = True
+                rental.save(update_fields=['price', 'activated', 'updated_at'])
+            return Response(status=status.HTTP_201_CREATED)
         return Response(status=status.HTTP_401_UNAUTHORIZED)
 
 class UserList(APIView):
 
     def get(self, request, format=None):
         if request.user.is_superuser:
-            serializer = UserSerializer(User.objects.all(), many=True)
-            return Response(serializer.data)
+            return paginated_response(request, User.objects.all(), UserSerializer, self)
         if request.user.is_authenticated:
-            serializer = UserSerializer(User.objects.filter(pk=request.user.pk), many=True)
-            return Response(serializer.data)
+            return paginated_response(request, User.objects.filter(pk=request.user.pk), UserSerializer, self)
         return Response(status=status.HTTP_401_UNAUTHORIZED)
     
     def post(self, request, format=None):
@@ -373,4 +576,27 @@ class UserDetail(APIView):
                 user = User.objects.get(pk=pk)
                 user.delete()
                 return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(status=status.HTTP_401_UNAUTHORIZED)
\ No newline at end of file
+        return Response(status=status.HTTP_401_UNAUTHORIZED)
+
+class TokenObtain(TokenObtainPairView):
+    throttle_scope = 'login'
+
+
+class TokenRefresh(TokenRefreshView):
+    serializer_class = TokenRefreshSerializer
+
+
+class TokenRevoke(APIView):
+
+    def post(self, request, format=None):
+        """
+        Revoke the access token of the request and the given refresh token.
+        """
+        if not request.user.is_authenticated:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        serializer = TokenRevokeSerializer(data=request.data, context={'request': request})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        tokens = [token for token in (request.auth, serializer.validated_data.get('refresh')) if isinstance(token, Token)]
+        revoke(*tokens)
+        return Response(status=status.HTTP_204_NO_CONTENT)